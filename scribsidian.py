@@ -1,22 +1,68 @@
 #!/usr/bin/env python3
 
+import csv
+import hashlib
+import heapq
+import io
+import json
+import math
 import os
+import pickle
+import random
 import re
+import shutil
+import sqlite3
 import sys
+import tempfile
+import threading
+import time
 import unicodedata
+import zlib
+from array import array
+from bisect import bisect_right
 from pathlib import Path
-from collections import Counter, defaultdict
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from itertools import chain
+
+try:
+    import numpy as np
+except ImportError:
+    # Optional: the TF-IDF / BM25 engines fall back to pure Python
+    np = None
+
+# Where notes are written, relative to the working directory
+DEFAULT_OUTPUT_DIR = "../../scribsidian_outputs"
 
 # --------------------------
 # Utility Functions
 # --------------------------
 
+# Maximum number of distinct (text, max_length) slugs kept by slugify().
+# Author and source names repeat across batch runs; raise this with the
+# SCRIBSIDIAN_SLUG_CACHE_SIZE environment variable for very large
+# libraries, or set it to 0 to disable caching.
+SLUG_CACHE_SIZE = int(os.environ.get("SCRIBSIDIAN_SLUG_CACHE_SIZE", "4096"))
+
+SLUG_INVALID_CHARS = re.compile(r'[^a-z0-9\s-]')
+SLUG_WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=SLUG_CACHE_SIZE)
 def slugify(text, max_length=60):
-    """Convert text into a clean, lowercase, dash-separated slug."""
-    text = unicodedata.normalize("NFKD", text)
+    """
+    Convert text into a clean, lowercase, dash-separated slug.
+
+    Results are memoized in a bounded LRU cache (see SLUG_CACHE_SIZE), and
+    pure-ASCII text skips NFKD normalization, which cannot change it.
+    """
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
     text = text.lower()
-    text = re.sub(r'[^a-z0-9\s-]', '', text)
-    text = re.sub(r'\s+', '-', text)
+    text = SLUG_INVALID_CHARS.sub('', text)
+    text = SLUG_WHITESPACE.sub('-', text)
     return text[:max_length].rstrip('-')
 
 
@@ -31,83 +77,493 @@ def clean_text(text):
 # Noun Phrase Extraction & Tag Suggestion Engine
 # --------------------------
 
-STOPWORDS = {
+STOPWORDS = frozenset({
     "the", "and", "of", "to", "in", "for", "on", "at", "a", "an", "is", "are",
     "it", "its", "this", "that", "as", "with", "be", "by", "from", "we", "you",
     "our", "their", "your", "but", "or", "into", "over", "may", "been", "were",
     "however", "than"
-}
+})
+
+# Extra weight for phrases that are already tags in the vault: added to the
+# frequency engine's score, multiplied into TF-IDF / BM25 weights
+VAULT_TAG_BONUS = 5
+VAULT_TAG_WEIGHT = 2.0
+
+# BM25 term-frequency saturation and document-length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Lowercased alphabetic tokens, keeping hyphens/apostrophes
+WORD_TOKEN = re.compile(r"[a-z\-']+")
+
+# Bump whenever extract_noun_phrases() would return different phrases for
+# the same text, so phrases saved by earlier versions are not reused
+PHRASE_EXTRACTOR_VERSION = 1
+
 
 def extract_noun_phrases(text):
     """
     Heuristic extractor for multi-word noun/adjective phrases.
     Returns phrases in kebab-case (e.g., "human-attention").
-    """
-    # Lowercase and keep alphabetic tokens and hyphens/apostrophes
-    words = re.findall(r"[a-zA-Z\-']+", text.lower())
 
+    Stopwords and tokens starting with a hyphen or apostrophe end the
+    current phrase; single-letter phrases are dropped.
+    """
     phrases = []
     current = []
 
-    for w in words:
-        if w in STOPWORDS:
-            if len(current) > 0:
-                phrases.append(" ".join(current))
+    for w in WORD_TOKEN.findall(text.lower()):
+        if w in STOPWORDS or w[0] in "-'":
+            if current:
+                if len(current) > 1 or len(current[0]) > 1:
+                    phrases.append("-".join(current))
                 current = []
-        elif re.match(r"[a-z]+", w):
-            current.append(w)
         else:
-            if len(current) > 0:
-                phrases.append(" ".join(current))
-                current = []
+            current.append(w)
 
-    if current:
-        phrases.append(" ".join(current))
+    if current and (len(current) > 1 or len(current[0]) > 1):
+        phrases.append("-".join(current))
 
-    # Normalize multi-word to kebab-case and filter short fragments
-    cleaned = []
-    for p in phrases:
-        p = p.strip()
-        if len(p) > 1:
-            cleaned.append(p.replace(" ", "-"))
+    return phrases
 
-    return cleaned
 
+def extract_noun_phrases_many(texts):
+    """Batch form of extract_noun_phrases() for a whole book at once."""
+    extract = extract_noun_phrases
+    return [extract(text) for text in texts]
 
-def suggest_tags_for_all_quotes(quotes, max_suggestions=8):
+
+class PhraseIndex:
     """
-    Build relevance-weighted suggestions for each quote by combining:
-    - global phrase frequency across all quotes (global weight)
-    - a local relevance boost for phrases that appear in the specific quote
-    Results stored in quote["suggested_tags"] as a list of kebab-case tags.
+    Inverted index from noun phrase to the quotes that contain it.
+
+    Quote ids are positions in the quote list the index was built from.
+    postings maps phrase -> {quote id: occurrences}, and quote_phrases
+    keeps each quote's extracted phrases in order, so the tag engine, TUI
+    filters and writers can ask "which quotes mention X" without
+    re-extracting anything. The index can be saved next to the notes and
+    handed back to build() on a later run to reuse unchanged quotes' phrases.
+    """
+
+    VERSION = 1
+
+    def __init__(self, quote_phrases, text_hashes):
+        self.quote_phrases = quote_phrases
+        self.text_hashes = text_hashes
+        self.postings = {}
+        for quote_id, phrases in enumerate(quote_phrases):
+            for phrase in phrases:
+                counts = self.postings.setdefault(phrase, {})
+                counts[quote_id] = counts.get(quote_id, 0) + 1
+
+    @classmethod
+    def build(cls, quotes, previous=None, cache=None):
+        """
+        Index a list of quotes. Phrases for any quote whose text is already
+        in `previous` (an earlier PhraseIndex) or in the ParseCache are
+        reused, not re-extracted; newly extracted phrases are added to the cache.
+        """
+        known = previous.phrases_by_hash() if previous is not None else {}
+        text_hashes = [hashlib.sha1(q["text"].encode("utf-8")).hexdigest() for q in quotes]
+
+        if cache is not None:
+            unknown = [h for h in text_hashes if h not in known]
+            if unknown:
+                known.update(cache.get_phrases(unknown))
+
+        missing = [i for i, h in enumerate(text_hashes) if h not in known]
+        extracted = extract_noun_phrases_many(quotes[i]["text"] for i in missing)
+        fresh = dict(zip(missing, extracted))
+
+        if cache is not None and fresh:
+            cache.put_phrases({text_hashes[i]: phrases for i, phrases in fresh.items()})
+
+        quote_phrases = [
+            fresh[i] if i in fresh else list(known[h]) for i, h in enumerate(text_hashes)
+        ]
+        return cls(quote_phrases, text_hashes)
+
+    def __len__(self):
+        return len(self.quote_phrases)
+
+    def __contains__(self, phrase):
+        return phrase in self.postings
+
+    def quotes_with(self, phrase):
+        """{quote id: occurrences} for quotes containing phrase (empty if none)."""
+        return self.postings.get(phrase, {})
+
+    def document_frequency(self, phrase):
+        """Number of quotes containing phrase."""
+        return len(self.postings.get(phrase, ()))
+
+    def phrase_frequency(self, phrase):
+        """Total occurrences of phrase across all quotes."""
+        return sum(self.postings.get(phrase, {}).values())
+
+    def phrases_by_hash(self):
+        return dict(zip(self.text_hashes, self.quote_phrases))
+
+    def save(self, path):
+        """Write the index as JSON (atomically) so a later run can reuse it."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": self.VERSION,
+                "extractor": PHRASE_EXTRACTOR_VERSION,
+                "quotes": [[h, phrases] for h, phrases in zip(self.text_hashes, self.quote_phrases)],
+            }, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a saved index; None if it is missing, unreadable or outdated."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != cls.VERSION:
+            return None
+        if data.get("extractor") != PHRASE_EXTRACTOR_VERSION:
+            return None
+        quotes = data.get("quotes", [])
+        return cls([phrases for _, phrases in quotes], [h for h, _ in quotes])
+
+
+# Saved phrase indexes live here inside the output directory, one per source
+PHRASE_INDEX_DIR = ".scribsidian-phrases"
+
+
+def phrase_index_path(output_dir, metadata):
+    """Where the PhraseIndex for a source is saved in output_dir."""
+    return Path(output_dir) / PHRASE_INDEX_DIR / f"{metadata['source_slug']}.json"
+
+
+def _score_frequency(per_quote_phrases, max_suggestions, boost=None):
+    """
+    Original scoring: global phrase frequency across all quotes plus a flat
+    +5 boost for every occurrence of a phrase in the quote itself. Phrases
+    in `boost` (existing vault tags) get VAULT_TAG_BONUS on top.
     """
-    # Collect per-quote phrases and global counts
     global_phrases = Counter()
-    per_quote_phrases = []
+    for phrases in per_quote_phrases:
+        global_phrases.update(phrases)
+    if boost:
+        for phrase in global_phrases.keys() & boost:
+            global_phrases[phrase] += VAULT_TAG_BONUS
+
+    # Global part of the score is the same for every quote, so rank it once
+    # (score descending, then phrase alphabetical for determinism)
+    global_ranked = sorted(global_phrases.items(), key=lambda x: (-x[1], x[0]))
+
+    suggestions = []
+    for phrases in per_quote_phrases:
+        # local relevance boost on top of the global weight
+        local = Counter(phrases)
+        candidates = [
+            (global_phrases[phrase] + 5 * count, phrase)
+            for phrase, count in local.items()
+        ]
+
+        # Only the first max_suggestions unboosted phrases can still make the cut
+        taken = 0
+        for phrase, freq in global_ranked:
+            if taken >= max_suggestions:
+                break
+            if phrase not in local:
+                candidates.append((freq, phrase))
+                taken += 1
+
+        top = heapq.nsmallest(max_suggestions, candidates, key=lambda x: (-x[0], x[1]))
+        suggestions.append([tag for score, tag in top])
+
+    return suggestions
+
+
+def build_phrase_matrix(per_quote_phrases):
+    """
+    Build a sparse quote x phrase count matrix in CSR layout.
 
-    for q in quotes:
-        np_list = extract_noun_phrases(q["text"])
-        per_quote_phrases.append(np_list)
-        global_phrases.update(np_list)
+    Returns (vocab, indptr, indices, counts): row i covers
+    indices[indptr[i]:indptr[i + 1]], which are column ids into vocab,
+    with the matching term counts in counts.
+    """
+    vocab_ids = {}
+    indptr = [0]
+    indices = []
+    counts = []
+
+    for phrases in per_quote_phrases:
+        for phrase, tf in Counter(phrases).items():
+            indices.append(vocab_ids.setdefault(phrase, len(vocab_ids)))
+            counts.append(tf)
+        indptr.append(len(indices))
+
+    return list(vocab_ids), indptr, indices, counts
+
+
+def _weights_numpy(weighting, n_rows, n_cols, indptr, indices, counts):
+    """Score every non-zero cell of the phrase matrix in one vectorized pass."""
+    indptr = np.asarray(indptr, dtype=np.int64)
+    indices = np.asarray(indices, dtype=np.int64)
+    tf = np.asarray(counts, dtype=np.float64)
+    df = np.bincount(indices, minlength=n_cols).astype(np.float64)
+
+    if weighting == "tfidf":
+        idf = np.log((1 + n_rows) / (1 + df)) + 1
+        return tf * idf[indices]
+
+    # bm25
+    row_ids = np.repeat(np.arange(n_rows), np.diff(indptr))
+    doc_len = np.bincount(row_ids, weights=tf, minlength=n_rows)
+    avg_len = doc_len.mean() or 1.0
+    idf = np.log(1 + (n_rows - df + 0.5) / (df + 0.5))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len[row_ids] / avg_len)
+    return idf[indices] * tf * (BM25_K1 + 1) / (tf + norm)
+
+
+def _weights_python(weighting, n_rows, n_cols, indptr, indices, counts):
+    """Pure-Python equivalent of _weights_numpy() for installs without NumPy."""
+    df = Counter(indices)
+
+    if weighting == "tfidf":
+        idf = {j: math.log((1 + n_rows) / (1 + d)) + 1 for j, d in df.items()}
+        return [tf * idf[j] for j, tf in zip(indices, counts)]
+
+    # bm25
+    doc_len = [sum(counts[indptr[i]:indptr[i + 1]]) for i in range(n_rows)]
+    avg_len = (sum(doc_len) / n_rows if n_rows else 0) or 1.0
+    idf = {j: math.log(1 + (n_rows - d + 0.5) / (d + 0.5)) for j, d in df.items()}
+
+    weights = []
+    for i in range(n_rows):
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len[i] / avg_len)
+        for k in range(indptr[i], indptr[i + 1]):
+            tf = counts[k]
+            weights.append(idf[indices[k]] * tf * (BM25_K1 + 1) / (tf + norm))
+    return weights
+
+
+def _score_weighted(per_quote_phrases, max_suggestions, weighting, boost=None):
+    """
+    Rank each quote's own phrases by TF-IDF or BM25 weight, so phrases that
+    are common across the whole book no longer crowd out distinctive ones.
+    Weights of phrases in `boost` (existing vault tags) are multiplied by
+    VAULT_TAG_WEIGHT.
+    """
+    vocab, indptr, indices, counts = build_phrase_matrix(per_quote_phrases)
+    n_rows = len(per_quote_phrases)
+
+    if not indices:
+        return [[] for _ in range(n_rows)]
+
+    # Alphabetical rank of each phrase, used to break score ties
+    alpha_rank = [0] * len(vocab)
+    for rank, j in enumerate(sorted(range(len(vocab)), key=vocab.__getitem__)):
+        alpha_rank[j] = rank
+
+    suggestions = []
+
+    if np is not None:
+        weights = _weights_numpy(weighting, n_rows, len(vocab), indptr, indices, counts)
+        cols = np.asarray(indices, dtype=np.int64)
+        if boost:
+            factors = np.array([VAULT_TAG_WEIGHT if v in boost else 1.0 for v in vocab])
+            weights = weights * factors[cols]
+        row_ids = np.repeat(np.arange(n_rows), np.diff(indptr))
+
+        # One sort orders every row by (score desc, phrase asc) while keeping
+        # rows contiguous, so row i still lives in order[indptr[i]:indptr[i + 1]]
+        order = np.lexsort((np.asarray(alpha_rank)[cols], -weights, row_ids))
+        ranked_cols = cols[order].tolist()
+
+        for i in range(n_rows):
+            start = indptr[i]
+            stop = min(indptr[i + 1], start + max_suggestions)
+            suggestions.append([vocab[j] for j in ranked_cols[start:stop]])
+        return suggestions
+
+    weights = _weights_python(weighting, n_rows, len(vocab), indptr, indices, counts)
+    if boost:
+        weights = [
+            w * VAULT_TAG_WEIGHT if vocab[j] in boost else w for w, j in zip(weights, indices)
+        ]
+    for i in range(n_rows):
+        row = range(indptr[i], indptr[i + 1])
+        top = heapq.nsmallest(
+            max_suggestions, row, key=lambda k: (-weights[k], alpha_rank[indices[k]])
+        )
+        suggestions.append([vocab[indices[k]] for k in top])
+    return suggestions
+
+
+SCORING_ENGINES = {
+    "frequency": _score_frequency,
+    "tfidf": lambda phrases, k, boost=None: _score_weighted(phrases, k, "tfidf", boost),
+    "bm25": lambda phrases, k, boost=None: _score_weighted(phrases, k, "bm25", boost),
+}
 
-    for i, q in enumerate(quotes):
-        local = per_quote_phrases[i]
-        scores = defaultdict(int)
 
-        # global weight
-        for phrase, freq in global_phrases.items():
-            scores[phrase] += freq
+def suggest_tags_for_all_quotes(quotes, max_suggestions=8, engine="frequency", index=None,
+                                vocabulary=None):
+    """
+    Build relevance-weighted suggestions for each quote.
 
-        # local relevance boost
-        for phrase in local:
-            scores[phrase] += 5
+    engine selects the scoring method (see SCORING_ENGINES):
+    - "frequency": global phrase frequency plus a local boost for phrases
+      that appear in the specific quote (the original behaviour)
+    - "tfidf" / "bm25": rank the quote's own phrases by how distinctive
+      they are within the book; vectorized with NumPy when it is installed
+    Results stored in quote["suggested_tags"] as a list of kebab-case tags.
+
+    index is an optional PhraseIndex built from these quotes; one is built
+    if not given. Either way it is returned for later phrase lookups.
 
-        # sort by score descending, then phrase alphabetical for determinism
-        sorted_tags = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
-        top_tags = [tag for tag, score in sorted_tags[:max_suggestions]]
+    vocabulary is an optional TagVocabulary of tags already used in the
+    vault: phrases that nearly match an existing tag are suggested in the
+    vault's spelling, and existing tags are ranked higher.
+    """
+    if engine not in SCORING_ENGINES:
+        raise ValueError(
+            f"Unknown tag engine {engine!r}; choose from {', '.join(SCORING_ENGINES)}"
+        )
+
+    if index is None:
+        index = PhraseIndex.build(quotes)
+    if vocabulary:
+        canonical = vocabulary.canonical
+        per_quote_phrases = [[canonical(p) for p in phrases] for phrases in index.quote_phrases]
+        suggestions = SCORING_ENGINES[engine](per_quote_phrases, max_suggestions, vocabulary.tags)
+    else:
+        suggestions = SCORING_ENGINES[engine](index.quote_phrases, max_suggestions)
 
+    for q, top_tags in zip(quotes, suggestions):
         q["suggested_tags"] = top_tags
 
+    return index
+
+
+# --------------------------
+# Quote Model
+# --------------------------
+
+class Quote:
+    """
+    One highlight. Fields live in slots rather than a per-quote dict, and
+    page, colour and tag strings are interned, so a book's few hundred
+    distinct tags are stored once however many quotes carry them.
+
+    Quotes still behave like the dicts they replaced: quote["text"],
+    quote.get("tags", []), "patterns" in quote, dict(quote) and copy() all
+    work, and a field that was never set is missing, as a dict key would be.
+
+    - page, text: from the export
+    - location, color, added: Kindle location range, highlight colour and
+      "Added on" timestamp, where the export records them
+    - continued: set on a "Highlight Continued" piece that did not follow
+      the highlight it continues; order_quotes() joins them up
+    - suggested_tags, tags, patterns, duplicate_of: filled in by the pipeline
+    """
+
+    __slots__ = (
+        "page", "text", "location", "color", "added", "continued",
+        "suggested_tags", "tags", "patterns", "duplicate_of",
+    )
+    FIELDS = frozenset(__slots__)
+    INTERNED = frozenset({"page", "color", "suggested_tags", "tags", "patterns"})
+
+    def __init__(self, page="", text="", **fields):
+        # Set directly: parsers build one of these per highlight
+        object.__setattr__(self, "page", sys.intern(page))
+        object.__setattr__(self, "text", text)
+        for name, value in fields.items():
+            self[name] = value
+
+    def __setattr__(self, name, value):
+        if name in Quote.INTERNED:
+            if isinstance(value, str):
+                value = sys.intern(value)
+            elif isinstance(value, (list, tuple)):
+                value = [sys.intern(v) for v in value]
+        object.__setattr__(self, name, value)
+
+    def __getitem__(self, key):
+        if key in Quote.FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in Quote.FIELDS:
+            raise KeyError(f"Quote has no field {key!r}")
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return key in Quote.FIELDS and hasattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in Quote.FIELDS else default
+
+    _MISSING = object()
+
+    def pop(self, key, default=_MISSING):
+        value = self.get(key, Quote._MISSING)
+        if value is Quote._MISSING:
+            if default is Quote._MISSING:
+                raise KeyError(key)
+            return default
+        delattr(self, key)
+        return value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, fields=(), **more):
+        for key, value in chain(dict(fields).items(), more.items()):
+            self[key] = value
+
+    def keys(self):
+        return [name for name in self.__slots__ if hasattr(self, name)]
+
+    def values(self):
+        return [getattr(self, name) for name in self.keys()]
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def copy(self):
+        """Shallow copy, like dict.copy() (tag lists are copied by interning)."""
+        return Quote(**dict(self))
+
+    def __eq__(self, other):
+        if isinstance(other, (Quote, dict)):
+            return dict(self) == dict(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Quote({dict(self)!r})"
+
 
 # --------------------------
 # Quote Parsing (your improved version)
@@ -124,44 +580,1077 @@ def clean_quote_text(text):
 
     return text.strip()
 
+# Line-level patterns for the "Page X | Highlight" export format; the
+# header may name the highlight colour, as in "Page 12 | Highlight (Yellow)"
+HIGHLIGHT_HEADER = re.compile(r"Page\s+(.*?)\s*\|\s*Highlight(?:\s*\((\w+)\))?\s*$")
+CONTINUED_HEADER = re.compile(r"Page\s+(\S+)\s*\|\s*Highlight\s+Continued\s*$")
+# Any other entry's header ("Page 12 | Note", "Page 5 | Bookmark"); a text
+# line that merely starts with "Page " is part of the quote
+ENTRY_HEADER = re.compile(r"Page\s+\S+\s*\|\s*[A-Za-z]+(?:\s*\(\w+\))?\s*$")
+BARE_NUMBER_LINE = re.compile(r"\d+\s*$")
+PAGE_DIGITS = re.compile(r"(\d+)")
+
+
+def _clean_page(page):
+    """Page number from a header's page string - just the number if present."""
+    page_clean = page.strip()
+    page_match = PAGE_DIGITS.search(page_clean)
+    return page_match.group(1) if page_match else page_clean
+
+
+def _make_quote(page, lines, color=None, continued=False):
+    """Build a Quote from a header page string, its raw text lines and colour (if named)."""
+    quote = Quote(_clean_page(page), clean_quote_text("\n".join(lines)))
+    if color:
+        quote.color = color.lower()
+    if continued:
+        quote.continued = True
+    return quote
+
+
+def _continues_on(page, continued_page):
+    """Whether a "Highlight Continued" header on continued_page can follow a quote from page."""
+    first, second = page_sort_key(_clean_page(page)), page_sort_key(_clean_page(continued_page))
+    return first == second or (first[0] == second[0] < 2 and second[1] - first[1] == 1)
+
+
+def iter_quotes(stream):
+    """
+    Incrementally parse Kindle highlights from a file, stdin, or any iterable of lines.
+
+    Quotes are yielded one at a time as soon as their text is complete, so
+    memory use depends on the longest single highlight rather than the size
+    of the export. "Page X | Highlight Continued" lines are merged into the
+    quote they continue, along with the stray page-number line Kindle often
+    prints just before them. A continuation from some other page than the
+    quote before it is yielded as a separate piece, marked continued, for
+    order_quotes() to join to its start.
+    """
+    page = None       # page string of the quote being collected (None = outside a quote)
+    color = None      # highlight colour named in its header, if any
+    continued = False # whether the current quote is an out-of-order continuation
+    lines = []        # raw text lines of the current quote
+    pending = None    # bare number line held back until we know what follows it
+
+    for line in stream:
+        line = line.rstrip("\r\n")
+
+        header = CONTINUED_HEADER.match(line)
+        if header:
+            # Drop the page-number artifact and keep collecting the same quote
+            pending = None
+            if page is None or not _continues_on(page, header.group(1)):
+                if page is not None:
+                    yield _make_quote(page, lines, color, continued)
+                page, color, continued, lines = header.group(1), None, True, []
+            continue
+
+        if pending is not None:
+            if page is not None:
+                lines.append(pending)
+            pending = None
+
+        header = HIGHLIGHT_HEADER.match(line)
+        if header:
+            if page is not None:
+                yield _make_quote(page, lines, color, continued)
+            page, color = header.groups()
+            continued = False
+            lines = []
+        elif ENTRY_HEADER.match(line):
+            # A note, bookmark or other entry ends the current quote
+            if page is not None:
+                yield _make_quote(page, lines, color, continued)
+            page = None
+            lines = []
+        elif page is not None:
+            if BARE_NUMBER_LINE.match(line):
+                pending = line
+            else:
+                lines.append(line)
+
+    if page is not None:
+        if pending is not None:
+            lines.append(pending)
+        yield _make_quote(page, lines, color, continued)
+
+
 def parse_quotes(raw_text):
     """
     Parse Kindle highlights from raw text.
 
-    Preprocessing step: Remove "Highlight Continued" lines to merge split quotes.
-    This handles cases where a quote is split across pages with "Highlight Continued".
+    Thin wrapper around iter_quotes() for callers that already hold the
+    whole export in memory and want a list back.
     """
-    # Remove standalone page numbers followed by "Highlight Continued"
-    # Pattern: "\n13\nPage 88 | Highlight Continued\n" → "\n"
-    raw_text = re.sub(r'\n\d+\s*\nPage\s+\d+\s*\|\s*Highlight\s+Continued\s*\n', '\n', raw_text)
+    return list(iter_quotes(io.StringIO(raw_text)))
 
-    # Remove any remaining "Page X | Highlight Continued" lines
-    # Pattern: "\nPage 88 | Highlight Continued\n" → "\n"
-    raw_text = re.sub(r'\nPage\s+\d+\s*\|\s*Highlight\s+Continued\s*\n', '\n', raw_text)
 
-    # Now parse quotes (only matches "Highlight", not "Highlight Continued" since we removed those)
-    QUOTE_PATTERN = r"Page\s+(.*?)\s*\|\s*Highlight\s*\n(.*?)(?=\nPage\s+|\Z)"
-    matches = re.findall(QUOTE_PATTERN, raw_text, re.DOTALL)
+class IncrementalQuoteParser:
+    """
+    Keeps a parsed copy of an export that is being edited (e.g. in the TUI)
+    and re-parses only the part that changed.
+
+    The text is cached as segments that each start at a "Page X | Highlight"
+    header; parsing the segments separately gives the same quotes as
+    parsing the whole text. update() finds the changed lines by comparing
+    with the previous text, re-parses just the segments around them and
+    reuses every other segment's quotes. Text in another export format
+    (see detect_export_format()) is parsed whole instead, and the books it
+    names are listed in books, so callers can tell when quotes from
+    several books are mixed. Safe to call from a worker thread.
+    """
 
-    quotes = []
-    for page, text in matches:
-        # Clean page number - extract just the number if present
-        page_clean = page.strip()
-        page_match = re.search(r'(\d+)', page_clean)
-        page_number = page_match.group(1) if page_match else page_clean
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lines = [""]
+        self._segments = [(1, [])]  # (line count, quotes) per segment
+        self.count = 0
+        self.books = []  # (title, author) of each book named in the text
+
+    def update(self, text):
+        """Bring the cache in line with text; returns the number of quotes."""
+        export_format = detect_export_format(text[:SNIFF_BYTES])
+        if export_format != "highlights":
+            books = split_export_books(text.split("\n"), export_format)
+            with self._lock:
+                # Forget the segments so returning to highlights re-parses everything
+                self._lines = None
+                self._segments = [(0, [quote for _, quotes in books for quote in quotes])]
+                self.books = [book for book, _ in books if book]
+                self.count = len(self._segments[0][1])
+                return self.count
+
+        with self._lock:
+            self.books = []
+            if self._lines is None:
+                self._lines = [""]
+                self._segments = [(1, [])]
+            old = self._lines
+            new = text.split("\n")
+            n_old, n_new = len(old), len(new)
+
+            # Common prefix and suffix (in lines) that did not change
+            limit = min(n_old, n_new)
+            p = 0
+            while p < limit and old[p] == new[p]:
+                p += 1
+            if p == n_old == n_new:
+                return self.count
+            q = 0
+            while q < limit - p and old[n_old - 1 - q] == new[n_new - 1 - q]:
+                q += 1
+            changed_end = n_old - q
+
+            # Old segments [first, last) covering the change: from the segment
+            # holding line p - 1 (an edited header may merge into it) up to the
+            # first unchanged header at or after the end of the change
+            first = last = None
+            start = 0
+            for i, (length, _) in enumerate(self._segments):
+                if first is None and start + length > max(p - 1, 0):
+                    first, region_start = i, start
+                start += length
+                if first is not None and start >= changed_end and start > region_start:
+                    last, region_end = i + 1, start
+                    break
+
+            region = new[region_start:region_end + n_new - n_old]
+            self._segments[first:last] = self._segment(region)
+            self._lines = new
+            self.count = sum(len(quotes) for _, quotes in self._segments)
+            return self.count
+
+    def quotes(self):
+        """Fresh copies of the Quotes for the current text, in order."""
+        with self._lock:
+            return [q.copy() for _, quotes in self._segments for q in quotes]
+
+    @staticmethod
+    def _segment(lines):
+        """Split lines at highlight headers and parse each piece."""
+        segments = []
+        start = 0
+        for i in range(1, len(lines)):
+            if HIGHLIGHT_HEADER.match(lines[i]):
+                segments.append(lines[start:i])
+                start = i
+        if start < len(lines):
+            segments.append(lines[start:])
+        return [(len(seg), list(iter_quotes(seg))) for seg in segments]
+
+
+# --------------------------
+# Export Formats
+# --------------------------
+
+# How much of an export is read to recognise its format
+SNIFF_BYTES = 4096
+
+# Used when no registered format recognises an export
+DEFAULT_EXPORT_FORMAT = "highlights"
+
+# Bump whenever parsing an export would give different books or quotes
+# (or store them differently), so cached parses are not reused
+EXPORT_PARSER_VERSION = 2
+
+# Kindle's "My Clippings.txt": every clipping on every book, oldest first,
+# each one a title line, a metadata line, a blank line, the text and a
+# separator:
+#
+#   Stand out of our Light (James Williams)
+#   - Your Highlight on page 88 | Location 1341-1343 | Added on Sunday, 3 March 2019 14:21:05
+#
+#   The liberation of human attention may be the defining moral ...
+#   ==========
+CLIPPINGS_SEPARATOR = re.compile(r"={10}\s*$")
+CLIPPING_TITLE = re.compile(r"(.*?)\s*\(([^()]*)\)\s*$")
+CLIPPING_META = re.compile(r"-\s*(?:Your\s+)?(Highlight|Note|Bookmark|Clip)\b(.*)", re.IGNORECASE)
+CLIPPING_PAGE = re.compile(r"\bpage\s+([0-9ivxlcdm]+)", re.IGNORECASE)
+CLIPPING_LOCATION = re.compile(r"\b(?:location|loc\.)\s+(\d+(?:-\d+)?)", re.IGNORECASE)
+CLIPPING_ADDED = re.compile(r"\bAdded on\s+(.*?)\s*$", re.IGNORECASE)
+
+# Clipping kinds that carry highlighted text; notes and bookmarks are skipped
+CLIPPING_KINDS = {"highlight", "clip"}
+
+# name -> (sniff, parse); see register_export_format()
+EXPORT_FORMATS = {}
+
+
+def register_export_format(name, sniff, parse):
+    """
+    Make an export format available to detect_export_format() and
+    iter_export(). sniff(head) is given the first SNIFF_BYTES of an export
+    as text and returns whether it is in this format; parse(lines) yields
+    (book, quote) pairs from an iterable of lines, where book is a (title,
+    author) tuple, or None for formats that hold a single unnamed book.
+    Formats are tried in registration order.
+    """
+    EXPORT_FORMATS[name] = (sniff, parse)
+
+
+def detect_export_format(head):
+    """Name of the first registered format whose sniff() accepts head."""
+    for name, (sniff, _) in EXPORT_FORMATS.items():
+        if sniff(head):
+            return name
+    return DEFAULT_EXPORT_FORMAT
+
+
+def iter_export(stream, export_format=None):
+    """
+    Yield (book, quote) pairs from a file, stdin, or any iterable of lines,
+    in whichever registered format the first SNIFF_BYTES look like (or in
+    export_format). Reads the stream once, so stdin works too.
+    """
+    stream = iter(stream)
+    head = []
+    rest = stream
+    if export_format is None:
+        size = 0
+        for line in stream:
+            head.append(line)
+            size += len(line)
+            if size >= SNIFF_BYTES:
+                break
+        else:
+            # The whole export fit in the sniff: a terminal's stdin must not
+            # be read again past its EOF, or it waits for another Ctrl-D
+            rest = ()
+        export_format = detect_export_format("".join(head))
+    _, parse = EXPORT_FORMATS[export_format]
+    return parse(chain(head, rest))
+
+
+def split_export_books(stream, export_format=None):
+    """
+    One pass over an export, grouped per book: a list of (book, quotes) in
+    the order each book first appears. Clippings from different books can
+    be interleaved in the export; each book's quotes keep their order.
+    """
+    books = {}
+    for book, quote in iter_export(stream, export_format):
+        books.setdefault(book, []).append(quote)
+    return list(books.items())
+
+
+def _sniff_highlights(head):
+    return any(HIGHLIGHT_HEADER.match(line) for line in head.splitlines())
+
+
+def _parse_highlights(lines):
+    return ((None, quote) for quote in iter_quotes(lines))
+
+
+def _sniff_clippings(head):
+    lines = head.lstrip("\ufeff").splitlines()
+    return (
+        any(CLIPPINGS_SEPARATOR.match(line) for line in lines)
+        and any(CLIPPING_META.match(line) for line in lines)
+    )
 
-        quotes.append({
-            "page": page_number,
-            "text": clean_quote_text(text),
-        })
-    return quotes
+
+def _make_clipping(lines):
+    """((title, author), quote) for one clipping's lines, or None if it has no highlighted text."""
+    lines = [line.lstrip("\ufeff") for line in lines]
+    while lines and not lines[0].strip():
+        lines.pop(0)
+    if len(lines) < 2:
+        return None
+    meta = CLIPPING_META.match(lines[1].strip())
+    if meta is None or meta.group(1).lower() not in CLIPPING_KINDS:
+        return None
+    text = clean_quote_text("\n".join(lines[2:]))
+    if not text:
+        return None
+
+    title_line = lines[0].strip()
+    title = CLIPPING_TITLE.match(title_line)
+    book = (title.group(1), title.group(2).strip()) if title else (title_line, "")
+
+    details = meta.group(2)
+    page = CLIPPING_PAGE.search(details)
+    quote = Quote(page.group(1) if page else "", text)
+    location = CLIPPING_LOCATION.search(details)
+    if location:
+        quote.location = location.group(1)
+    added = CLIPPING_ADDED.search(details)
+    if added:
+        quote.added = added.group(1)
+    return book, quote
+
+
+def iter_clippings(lines):
+    """
+    Incrementally parse a Kindle "My Clippings.txt", yielding ((title,
+    author), quote) for each highlight as soon as its separator is read.
+    Quotes also carry the clipping's location and "Added on" timestamp.
+    """
+    entry = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if CLIPPINGS_SEPARATOR.match(line):
+            clipping = _make_clipping(entry)
+            if clipping is not None:
+                yield clipping
+            entry = []
+        else:
+            entry.append(line)
+
+    # A final clipping without its separator (e.g. a truncated copy)
+    clipping = _make_clipping(entry)
+    if clipping is not None:
+        yield clipping
+
+
+register_export_format("highlights", _sniff_highlights, _parse_highlights)
+register_export_format("clippings", _sniff_clippings, iter_clippings)
+
+
+# --------------------------
+# Page Ordering
+# --------------------------
+
+ROMAN_PAGE = re.compile(r"[ivxlcdm]+")
+ROMAN_VALUES = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100, "d": 500, "m": 1000}
+
+# Kindle location ranges: "1341-1343", or "1341-43" on older devices
+LOCATION_RANGE = re.compile(r"(\d+)(?:-(\d+))?$")
+
+
+@lru_cache(maxsize=4096)
+def page_sort_key(page):
+    """
+    Sort key for a page label: front-matter roman numerals ("xii") first,
+    in numeric order, then arabic page numbers, then anything else
+    (including no page) by its text.
+    """
+    label = str(page).strip().lower()
+    if label.isdigit():
+        return (1, int(label), "")
+    if ROMAN_PAGE.fullmatch(label):
+        values = [ROMAN_VALUES[c] for c in label]
+        # A numeral smaller than the one after it is subtracted ("iv", "xc")
+        total = sum(-v if v < after else v for v, after in zip(values, values[1:] + [0]))
+        return (0, total, "")
+    return (2, 0, label)
+
+
+def location_range(location):
+    """(start, end) of a Kindle location string, or None if it has none."""
+    match = LOCATION_RANGE.match(str(location or "").strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if end is None:
+        return int(start), int(start)
+    if len(end) < len(start):
+        end = start[:len(start) - len(end)] + end
+    return int(start), max(int(start), int(end))
+
+
+# Fewest words two highlights must share to be stitched together at the overlap
+MIN_OVERLAP_WORDS = 3
+
+
+def overlap_highlight_texts(first, second):
+    """
+    One passage from two highlights whose texts overlap (one contains the
+    other, or first ends with words second starts with), else None.
+    """
+    if second in first:
+        return first
+    if first in second:
+        return second
+    words, more = first.split(), second.split()
+    # Longest run of words ending first that also starts second
+    for overlap in range(min(len(words), len(more)) - 1, MIN_OVERLAP_WORDS - 1, -1):
+        if words[-overlap:] == more[:overlap]:
+            return " ".join(words + more[overlap:])
+    return None
+
+
+def _join_quotes(quote, piece, text):
+    """Fold piece into quote: the joined text, and the location range covering both."""
+    quote.text = text
+    first, second = location_range(quote.get("location")), location_range(piece.get("location"))
+    if first and second:
+        start, end = min(first[0], second[0]), max(first[1], second[1])
+        quote.location = f"{start}-{end}" if end > start else str(start)
+
+
+def order_quotes(quotes):
+    """
+    Put one book's quotes in reading order and join highlights that were
+    split apart. Returns (ordered quotes, number of pieces joined away).
+
+    When every quote has a Kindle location, quotes are sorted by location
+    and any whose ranges overlap (a highlight extended, or split across a
+    page break) are merged in one sweep. Otherwise quotes are sorted by
+    page_sort_key(), keeping export order within a page, and each
+    out-of-order "Highlight Continued" piece is joined to the last
+    highlight starting on or before its page, found by binary search.
+    Either way it is O(n log n) in the number of quotes.
+    """
+    if not quotes:
+        return [], 0
+
+    ranges = [location_range(q.get("location")) for q in quotes]
+    if all(ranges):
+        order = sorted(range(len(quotes)), key=lambda i: (ranges[i], i))
+        ordered = [quotes[order[0]]]
+        end = ranges[order[0]][1]
+        for i in order[1:]:
+            start, stop = ranges[i]
+            # Neighbouring highlights often share a location; only join real overlaps
+            text = overlap_highlight_texts(ordered[-1].text, quotes[i].text) if start <= end else None
+            if text is not None:
+                _join_quotes(ordered[-1], quotes[i], text)
+            else:
+                ordered.append(quotes[i])
+            end = max(end, stop)
+        return ordered, len(quotes) - len(ordered)
+
+    keys = [page_sort_key(q["page"]) for q in quotes]
+    starts = sorted(
+        (i for i, q in enumerate(quotes) if not q.get("continued")), key=lambda i: (keys[i], i)
+    )
+    ordered = [quotes[i] for i in starts]
+    start_keys = [keys[i] for i in starts]
+
+    joined = 0
+    orphans = []
+    for i, quote in enumerate(quotes):
+        if not quote.get("continued"):
+            continue
+        # Last highlight on or before this page; pieces from before the
+        # first highlight are kept on their own, ahead of it
+        target = bisect_right(start_keys, keys[i]) - 1
+        if target < 0:
+            del quote["continued"]
+            orphans.append(i)
+            continue
+        first = ordered[target]
+        text = overlap_highlight_texts(first.text, quote.text) or f"{first.text} {quote.text}"
+        _join_quotes(first, quote, text)
+        joined += 1
+
+    orphans.sort(key=lambda i: (keys[i], i))
+    return [quotes[i] for i in orphans] + ordered, joined
+
+
+# --------------------------
+# Parse Cache
+# --------------------------
+
+# Upper bound on the cache's stored payload; least recently used entries
+# are evicted past it. Override with SCRIBSIDIAN_CACHE_MAX_MB.
+CACHE_MAX_BYTES = int(float(os.environ.get("SCRIBSIDIAN_CACHE_MAX_MB", "256")) * 1024 * 1024)
+
+
+def default_cache_path():
+    """SQLite cache file: $SCRIBSIDIAN_CACHE_DIR, else $XDG_CACHE_HOME/scribsidian, else ~/.cache/scribsidian."""
+    cache_dir = os.environ.get("SCRIBSIDIAN_CACHE_DIR") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "scribsidian"
+    )
+    return Path(cache_dir) / "cache.sqlite3"
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-1 of a file's bytes, read in chunks so memory stays flat."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """
+    On-disk SQLite cache of parse results, shared by every run and every
+    batch worker process:
+
+    - exports: SHA-1 of a raw export file -> its parsed books and quotes
+    - phrases: SHA-1 of a quote's text -> its extracted noun phrases
+
+    Values are stored as zlib-compressed JSON. When the stored payload
+    grows past max_bytes, the least recently used entries are evicted.
+    The cache records which parser and extractor versions wrote each table
+    (see VERSIONS); opening it with different ones empties that table.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS exports (
+        hash TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS phrases (
+        hash TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS versions (
+        name TEXT PRIMARY KEY, version INTEGER NOT NULL
+    );
+    """
+
+    # Table -> version of the code that produces its entries
+    VERSIONS = {"exports": EXPORT_PARSER_VERSION, "phrases": PHRASE_EXTRACTOR_VERSION}
+
+    # SQLite's default limit on bound parameters is 999
+    BATCH = 500
+
+    def __init__(self, path=None, max_bytes=CACHE_MAX_BYTES):
+        self.path = Path(path) if path is not None else default_cache_path()
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(self.SCHEMA)
+        self._check_versions()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def _check_versions(self):
+        """Empty each table whose entries were written by another version."""
+        stored = dict(self.db.execute("SELECT name, version FROM versions"))
+        stale = [table for table, version in self.VERSIONS.items() if stored.get(table) != version]
+        if not stale:
+            return
+        with self.db:
+            for table in stale:
+                self.db.execute(f"DELETE FROM {table}")
+                self.db.execute(
+                    "INSERT OR REPLACE INTO versions (name, version) VALUES (?, ?)",
+                    (table, self.VERSIONS[table])
+                )
+
+    @staticmethod
+    def _pack(value):
+        # default=dict stores Quotes as plain objects
+        return zlib.compress(json.dumps(value, separators=(",", ":"), default=dict).encode("utf-8"))
+
+    @staticmethod
+    def _unpack(blob):
+        return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+    def get_quotes(self, export_hash):
+        """Parsed quotes for an export hash, or None."""
+        row = self.db.execute("SELECT data FROM exports WHERE hash = ?", (export_hash,)).fetchone()
+        if row is None:
+            return None
+        with self.db:
+            self.db.execute("UPDATE exports SET used = ? WHERE hash = ?", (time.time(), export_hash))
+        return self._unpack(row[0])
+
+    def put_quotes(self, export_hash, quotes):
+        self._put("exports", [(export_hash, quotes)])
+
+    def get_phrases(self, text_hashes):
+        """{text hash: phrases} for whichever of text_hashes are cached."""
+        found = {}
+        hashes = list(set(text_hashes))
+        for start in range(0, len(hashes), self.BATCH):
+            chunk = hashes[start:start + self.BATCH]
+            marks = ",".join("?" * len(chunk))
+            rows = self.db.execute(f"SELECT hash, data FROM phrases WHERE hash IN ({marks})", chunk)
+            found.update((h, self._unpack(data)) for h, data in rows)
+        if found:
+            now = time.time()
+            with self.db:
+                self.db.executemany(
+                    "UPDATE phrases SET used = ? WHERE hash = ?", ((now, h) for h in found)
+                )
+        return found
+
+    def put_phrases(self, phrases_by_hash):
+        self._put("phrases", phrases_by_hash.items())
+
+    def _put(self, table, items):
+        now = time.time()
+        rows = []
+        for key, value in items:
+            blob = self._pack(value)
+            rows.append((key, blob, len(blob), now))
+        if not rows:
+            return
+        with self.db:
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO {table} (hash, data, size, used) VALUES (?, ?, ?, ?)", rows
+            )
+        self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the payload fits in max_bytes."""
+        total = self.db.execute(
+            "SELECT (SELECT COALESCE(SUM(size), 0) FROM exports)"
+            " + (SELECT COALESCE(SUM(size), 0) FROM phrases)"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self.db.execute(
+            "SELECT 'exports', hash, size, used FROM exports"
+            " UNION ALL SELECT 'phrases', hash, size, used FROM phrases ORDER BY used"
+        )
+        doomed = {"exports": [], "phrases": []}
+        for table, key, size, _ in rows:
+            if total <= self.max_bytes:
+                break
+            doomed[table].append((key,))
+            total -= size
+
+        with self.db:
+            for table, keys in doomed.items():
+                self.db.executemany(f"DELETE FROM {table} WHERE hash = ?", keys)
+
+
+def open_parse_cache(path=None):
+    """Open the ParseCache, or return None (no caching) if it cannot be used."""
+    try:
+        return ParseCache(path)
+    except (OSError, sqlite3.Error):
+        return None
+
+
+def read_export_books(path, cache=None):
+    """
+    Parse one export file into a list of (book, quotes), as
+    split_export_books(), using the ParseCache when given: an unchanged
+    export (same bytes) is read back from the cache instead of re-parsed.
+    """
+    export_hash = None
+    if cache is not None:
+        export_hash = file_hash(path)
+        cached = cache.get_quotes(export_hash)
+        if cached is not None:
+            return [
+                (tuple(book) if book else None, [Quote(**q) for q in quotes])
+                for book, quotes in cached["books"]
+            ]
+
+    with open(path, encoding="utf-8-sig") as f:
+        books = split_export_books(f)
+
+    if cache is not None:
+        cache.put_quotes(export_hash, {"books": books})
+    return books
+
+
+def select_export_book(books, name):
+    """
+    Quotes of the book called name among read_export_books() results.
+    Titles are compared by slug, and a title that merely starts with name
+    (e.g. a subtitle follows it) also matches. Exports with a single book
+    (or unnamed books) return everything.
+    """
+    if len(books) <= 1 or all(book is None for book, _ in books):
+        return [quote for _, quotes in books for quote in quotes]
+
+    wanted = slugify(name)
+    exact = [quotes for book, quotes in books if book and slugify(book[0]) == wanted]
+    if exact:
+        return exact[0]
+    prefixed = [quotes for book, quotes in books if book and slugify(book[0]).startswith(wanted + "-")]
+    if len(prefixed) == 1:
+        return prefixed[0]
+
+    problem = "several books match" if prefixed else "no book matches"
+    raise ValueError(f"{problem} {name!r}; set the entry's \"book\" to the exact title")
+
+
+def read_export_file(path, cache_path=None):
+    """
+    read_export_books() for a worker process: the ParseCache at cache_path
+    (if given) is opened and closed here, so only picklable values cross.
+    """
+    cache = open_parse_cache(cache_path) if cache_path is not None else None
+    try:
+        return read_export_books(path, cache)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+# --------------------------
+# Near-Duplicate Detection
+# --------------------------
+
+# Highlights whose shingles overlap at least this much are treated as the
+# same passage (the shorter one's shingles found in the longer one within
+# an import; estimated Jaccard similarity against notes already written)
+DEDUP_THRESHOLD = 0.8
+
+# MinHash signature layout: LSH_BANDS bands of LSH_ROWS values each, which
+# makes pairs above ~0.5 similarity likely to share a bucket
+LSH_BANDS = 16
+LSH_ROWS = 4
+MINHASH_PERMUTATIONS = LSH_BANDS * LSH_ROWS
+
+# Shingles are word trigrams, hashed to 32 bits by mixing the CRC-32 of
+# each word; each MinHash permutation is a multiply-shift hash
+# ((a*x + b) mod 2**64) >> 32. Fixed seed, so signatures stay comparable
+# across runs.
+SHINGLE_MIX = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D)
+_minhash_rng = random.Random(20240601)
+MINHASH_A = tuple(_minhash_rng.getrandbits(64) | 1 for _ in range(MINHASH_PERMUTATIONS))
+MINHASH_B = tuple(_minhash_rng.getrandbits(64) for _ in range(MINHASH_PERMUTATIONS))
+
+SHINGLE_TOKEN = re.compile(r"[a-z0-9']+")
+
+# Signatures of every quote written to the vault, kept in the output directory
+NEAR_DUPLICATE_INDEX = ".scribsidian-minhash.sqlite3"
+
+
+@lru_cache(maxsize=65536)
+def _word_hash(word):
+    return zlib.crc32(word.encode("utf-8"))
+
+
+def _shingle_words(text):
+    """Word hashes of text, padded so there is always at least one trigram."""
+    hashes = list(map(_word_hash, SHINGLE_TOKEN.findall(text.lower())))
+    return hashes + [0] * (3 - len(hashes)) if len(hashes) < 3 else hashes
+
+
+def quote_shingles(text):
+    """Set of 32-bit word-trigram hashes for text (never empty)."""
+    h = _shingle_words(text)
+    m1, m2, m3 = SHINGLE_MIX
+    return {
+        ((h[i] * m1) ^ (h[i + 1] * m2) ^ (h[i + 2] * m3)) & 0xFFFFFFFF
+        for i in range(len(h) - 2)
+    }
+
+
+def minhash_signatures(texts, chunk_size=1024, shingle_sets=None):
+    """
+    MinHash signature (a tuple of MINHASH_PERMUTATIONS ints) for each
+    text. With NumPy, chunk_size texts are shingled and hashed per
+    vectorized step; the pure-Python path gives identical signatures.
+    Given a list as shingle_sets, each text's quote_shingles() is appended
+    to it as well, sparing callers a second shingling pass.
+    """
+    if np is None:
+        mask = (1 << 64) - 1
+        signatures = []
+        for shingles in map(quote_shingles, texts):
+            if shingle_sets is not None:
+                shingle_sets.append(shingles)
+            signatures.append(tuple(min(((a * x + b) & mask) >> 32 for x in shingles)
+                                    for a, b in zip(MINHASH_A, MINHASH_B)))
+        return signatures
+
+    m1, m2, m3 = (np.uint64(m) for m in SHINGLE_MIX)
+    a = np.array(MINHASH_A, dtype=np.uint64)[:, None]
+    b = np.array(MINHASH_B, dtype=np.uint64)[:, None]
+    texts = list(texts)
+    signatures = []
+    for start in range(0, len(texts), chunk_size):
+        words = [_shingle_words(t) for t in texts[start:start + chunk_size]]
+        lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+        flat = np.fromiter(chain.from_iterable(words), dtype=np.uint64, count=int(lengths.sum()))
+
+        # Trigram at every position, then keep those that stay inside one text
+        trigrams = ((flat[:-2] * m1) ^ (flat[1:-1] * m2) ^ (flat[2:] * m3)) & np.uint64(0xFFFFFFFF)
+        counts = lengths - 2
+        firsts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        shingles = trigrams[np.arange(counts.sum()) + np.repeat(starts - firsts, counts)]
+        if shingle_sets is not None:
+            values = shingles.tolist()
+            shingle_sets.extend(set(values[f:f + c]) for f, c in zip(firsts.tolist(), counts.tolist()))
+
+        hashed = (a * shingles + b) >> np.uint64(32)
+        signatures.extend(map(tuple, np.minimum.reduceat(hashed, firsts, axis=1).T.tolist()))
+    return signatures
+
+
+def lsh_bands(signature):
+    """One stable integer per band: band number in the high bits, CRC-32 of its values below."""
+    data = array("I", signature).tobytes()
+    width = 4 * LSH_ROWS
+    return [(band << 32) | zlib.crc32(data[band * width:(band + 1) * width])
+            for band in range(LSH_BANDS)]
+
+
+def signature_similarity(first, second):
+    """Estimated Jaccard similarity: the fraction of matching MinHash values."""
+    return sum(x == y for x, y in zip(first, second)) / len(first)
+
+
+class NearDuplicateIndex:
+    """
+    The vault's persistent LSH index: the MinHash signature of every quote
+    note written, keyed by quote_key(), with one indexed row per band.
+    Lookups only touch the bands of the quote being checked, so checking a
+    new book against the whole vault never loads the index into memory.
+    A key always names the same text, so its signature never changes;
+    entries for deleted notes are harmless and simply stop matching the
+    import manifest.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(str(path))
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS signatures (
+                id INTEGER PRIMARY KEY,
+                key TEXT UNIQUE NOT NULL,
+                signature BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bands (
+                band INTEGER NOT NULL,
+                id INTEGER NOT NULL,
+                PRIMARY KEY (band, id)
+            ) WITHOUT ROWID;
+        """)
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def most_similar(self, signature, threshold=DEDUP_THRESHOLD, key=None):
+        """
+        (similarity, key) of the closest indexed quote at or above threshold,
+        or None. If key is already indexed, only quotes indexed before it
+        count, so the first copy of a passage is never flagged as a
+        duplicate of a later one.
+        """
+        row = self.db.execute("SELECT id FROM signatures WHERE key = ?", (key,)).fetchone()
+        bands = lsh_bands(signature)
+        rows = self.db.execute(
+            "SELECT key, signature FROM signatures WHERE id < ? AND id IN "
+            f"(SELECT id FROM bands WHERE band IN ({','.join('?' * len(bands))}))",
+            [row[0] if row else sys.maxsize, *bands]
+        )
+        best = None
+        for key, packed in rows:
+            values = array("I")
+            values.frombytes(packed)
+            similarity = signature_similarity(signature, values)
+            if similarity >= threshold and (best is None or similarity > best[0]):
+                best = (similarity, key)
+        return best
+
+    def add_many(self, items):
+        """Index (key, signature) pairs; keys already present are left alone."""
+        bands = []
+        with self.db:
+            for key, signature in items:
+                cursor = self.db.execute(
+                    "INSERT OR IGNORE INTO signatures (key, signature) VALUES (?, ?)",
+                    (key, array("I", signature).tobytes())
+                )
+                if cursor.rowcount:
+                    bands.extend((band, cursor.lastrowid) for band in lsh_bands(signature))
+            # In key order, so the band index is appended to rather than split
+            bands.sort()
+            self.db.executemany("INSERT OR IGNORE INTO bands (band, id) VALUES (?, ?)", bands)
+
+
+def open_near_duplicate_index(output_dir):
+    """Open the vault's NearDuplicateIndex, or return None if it cannot be used."""
+    try:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        return NearDuplicateIndex(Path(output_dir) / NEAR_DUPLICATE_INDEX)
+    except (OSError, sqlite3.Error):
+        return None
+
+
+def _overlaps_python(shingles, order, required):
+    """
+    {i: earlier quotes (in order) holding at least required[i] of quote i's
+    shingles}. Every quote's shingles go into an inverted index as it is
+    passed; only the prefix-filter probes (see merge_near_duplicates()) are
+    looked up in it.
+    """
+    frequency = Counter(chain.from_iterable(shingles))
+    postings = {}  # shingle -> ids of quotes already passed
+    overlaps = {}
+    for i in order:
+        mine = shingles[i]
+        probes = sorted(mine, key=frequency.__getitem__)[:len(mine) - required[i] + 1]
+        candidates = set()
+        for shingle in probes:
+            candidates.update(postings.get(shingle, ()))
+        found = [j for j in candidates if len(mine & shingles[j]) >= required[i]]
+        if found:
+            overlaps[i] = found
+        # A shingle no other quote has can never lead back here
+        for shingle in mine:
+            if frequency[shingle] > 1:
+                postings.setdefault(shingle, []).append(i)
+    return overlaps
+
+
+def _overlaps_numpy(shingles, order, required):
+    """
+    Same as _overlaps_python(). The prefix-filter probes of every quote are
+    joined against every earlier quote at once; only the candidate pairs
+    that turn up are checked exactly.
+    """
+    n = len(shingles)
+    lengths = np.fromiter(map(len, shingles), dtype=np.int64, count=n)
+    owners = np.repeat(np.arange(n), lengths)
+    values = np.fromiter(chain.from_iterable(shingles), dtype=np.int64, count=int(lengths.sum()))
+    columns, frequency = np.unique(values, return_inverse=True, return_counts=True)[1:]
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+
+    # Each quote's rarest shingles, ties by value, as its probes
+    by_rarity = np.lexsort((values, frequency[columns], owners))
+    firsts = np.cumsum(lengths) - lengths
+    position = np.arange(len(values)) - firsts[owners[by_rarity]]
+    probe_counts = lengths - np.asarray(required, dtype=np.int64) + 1
+    probes = by_rarity[
+        (position < probe_counts[owners[by_rarity]]) & (frequency[columns[by_rarity]] > 1)
+    ]
+
+    # Every quote holding each shared shingle
+    shared = np.flatnonzero(frequency[columns] > 1)
+    holders = owners[shared[np.argsort(columns[shared], kind="stable")]]
+    holder_counts = np.bincount(columns[shared], minlength=len(frequency))
+    holder_starts = np.cumsum(holder_counts) - holder_counts
+
+    counts = holder_counts[columns[probes]]
+    others = holders[_expand_ranges(holder_starts[columns[probes]], counts)]
+    quotes = np.repeat(owners[probes], counts)
+    earlier = rank[others] < rank[quotes]
+    pairs = np.unique(quotes[earlier] * n + others[earlier])
+
+    overlaps = {}
+    for i, j in zip(*(column.tolist() for column in np.divmod(pairs, n))):
+        if len(shingles[i] & shingles[j]) >= required[i]:
+            overlaps.setdefault(i, []).append(j)
+    return overlaps
+
+
+def merge_near_duplicates(quotes, threshold=DEDUP_THRESHOLD):
+    """
+    Drop highlights whose words all appear, in order, in a longer highlight
+    of the same import (the same passage highlighted twice, or extended
+    later), so no highlighted text is lost. Returns (kept quotes in their
+    original order, their MinHash signatures, number of quotes merged away,
+    number of kept quotes that share at least threshold of their shingles
+    with a longer kept one without being contained in it).
+
+    Overlaps are found exactly, with prefix filtering to find candidates:
+    a quote holding at least threshold of a highlight's m shingles must
+    share one of any m - ceil(threshold * m) + 1 of them, so only that many
+    of its rarest shingles are looked up. Containment is then confirmed on
+    the highlights' words. MinHash/LSH estimates Jaccard similarity, which
+    is low for a short highlight inside a long extension, so it is only
+    used against the vault (see flag_near_duplicates()).
+    """
+    texts = [q["text"] for q in quotes]
+    shingles = []
+    signatures = minhash_signatures(texts, shingle_sets=shingles)
+    required = [math.ceil(threshold * len(mine) - 1e-9) for mine in shingles]
+
+    # Longest first, so a highlight is merged into the extension that contains it
+    order = sorted(range(len(quotes)), key=lambda i: -len(texts[i]))
+    find_overlaps = _overlaps_numpy if np is not None and quotes else _overlaps_python
+    overlaps = find_overlaps(shingles, order, required)
+
+    words = {}
+
+    def spaced_words(i):
+        if i not in words:
+            words[i] = f" {' '.join(SHINGLE_TOKEN.findall(texts[i].lower()))} "
+        return words[i]
+
+    def contains(j, i):
+        if not spaced_words(i).strip():
+            return texts[i].strip() == texts[j].strip()
+        return spaced_words(i) in spaced_words(j)
+
+    rank = {i: position for position, i in enumerate(order)}
+    dropped = set()
+    overlapping = 0
+    for i in sorted(overlaps, key=rank.__getitem__):
+        kept = [j for j in overlaps[i] if j not in dropped]
+        if any(contains(j, i) for j in kept):
+            dropped.add(i)
+        elif kept:
+            overlapping += 1
+
+    keep = [i for i in range(len(quotes)) if i not in dropped]
+    return [quotes[i] for i in keep], [signatures[i] for i in keep], len(dropped), overlapping
+
+
+def flag_near_duplicates(quotes, signatures, metadata, index, manifest, threshold=DEDUP_THRESHOLD):
+    """
+    Mark quotes that closely match a note already in the vault: the
+    match's note name goes in quote["duplicate_of"] (written as a
+    "duplicate-of" wikilink). manifest is the import manifest, used to find
+    the note each key was written to. Every quote's signature is then added
+    to index (a NearDuplicateIndex). Returns the number of quotes flagged.
+    """
+    keys = [quote_key(q, metadata) for q in quotes]
+    flagged = 0
+    for quote, key, signature in zip(quotes, keys, signatures):
+        match = index.most_similar(signature, threshold, key=key)
+        entry = manifest.get(match[1]) if match is not None else None
+        if entry and entry.get("filename"):
+            quote["duplicate_of"] = Path(entry["filename"]).stem
+            flagged += 1
+        else:
+            quote.pop("duplicate_of", None)
+    index.add_many(zip(keys, signatures))
+    return flagged
 
 
 # --------------------------
 # File Generation Helpers
 # --------------------------
 
-def write_quote_file(quote, metadata):
+def render_quote_note(quote, metadata):
+    """Return (filename, content) for a quote note without touching disk."""
     slug = slugify(quote["text"][:80])
     filename = f"{slug}.md"
 
@@ -171,22 +1660,31 @@ def write_quote_file(quote, metadata):
         # ensure there's a placeholder empty item so YAML keeps the field visible
         tag_block = "tags:\n  -\n"
 
+    # Optional fields: writing-pattern IDs, only for quotes run through a
+    # PatternClassifier, and a link to the note this quote duplicates
+    extra_block = ""
+    if quote.get("patterns"):
+        extra_block = "patterns:\n" + "".join(f"  - {p}\n" for p in quote["patterns"])
+
+    if quote.get("duplicate_of"):
+        extra_block += f"duplicate-of: \"[[{quote['duplicate_of']}]]\"\n"
+
     content = f"""---
 note-type: quote
 source: "[[{metadata['source_slug']}]]"
 author: "[[{metadata['author_slug']}]]"
 {tag_block}
 page: {quote['page']}
----
+{extra_block}---
 
 > {quote['text']}
 """
 
-    with open(filename, "w") as f:
-        f.write(content)
+    return filename, content
 
 
-def write_author_note(metadata):
+def render_author_note(metadata):
+    """Return (filename, content) for the author note."""
     filename = f"{metadata['author_slug']}.md"
     content = f"""---
 note-type: author
@@ -194,11 +1692,11 @@ note-type: author
 
 A short bio can go here.
 """
-    with open(filename, "w") as f:
-        f.write(content)
+    return filename, content
 
 
-def write_source_note(metadata):
+def render_source_note(metadata):
+    """Return (filename, content) for the source note."""
     filename = f"{metadata['source_slug']}.md"
 
     # Format YAML tag block
@@ -231,10 +1729,1141 @@ citation: {citation}
 Summary goes here.
 """
 
+    return filename, content
+
+
+def write_quote_file(quote, metadata):
+    filename, content = render_quote_note(quote, metadata)
     with open(filename, "w") as f:
         f.write(content)
 
 
+def write_author_note(metadata):
+    filename, content = render_author_note(metadata)
+    with open(filename, "w") as f:
+        f.write(content)
+
+
+def write_source_note(metadata):
+    filename, content = render_source_note(metadata)
+    with open(filename, "w") as f:
+        f.write(content)
+
+
+def render_keyed_notes(quotes, metadata):
+    """
+    Render the author, source and quote notes for one book in memory as
+    (key, filename, content, info) tuples. key identifies the note across
+    re-imports (see quote_key()); info holds the page and tags recorded in
+    the import manifest for quote notes.
+    """
+    notes = [
+        (f"author:{metadata['author_slug']}", *render_author_note(metadata), {}),
+        (f"source:{metadata['source_slug']}", *render_source_note(metadata), {}),
+    ]
+    for quote in quotes:
+        filename, content = render_quote_note(quote, metadata)
+        info = {"page": quote["page"], "tags": list(quote.get("tags", []))}
+        notes.append((quote_key(quote, metadata), filename, content, info))
+    return notes
+
+
+def render_all_notes(quotes, metadata):
+    """
+    Render the author, source and quote notes for one book in memory.
+    Returns an ordered {filename: content} dict; as with the one-file
+    writers, a later note with the same filename replaces an earlier one.
+    """
+    return {filename: content for key, filename, content, info in render_keyed_notes(quotes, metadata)}
+
+
+def write_notes_atomically(notes, output_dir=".", fsync=False):
+    """
+    Write a batch of rendered notes ({filename: content}) into output_dir
+    all-or-nothing.
+
+    Every note is first written to a staging directory inside output_dir,
+    then moved into place with os.replace(). If anything fails, notes that
+    were already moved are rolled back (overwritten files restored, new
+    files removed) and the staging directory is deleted, so the vault is
+    never left half-written.
+
+    With fsync=True the staged data is flushed to disk once for the whole
+    batch before anything is moved, and the directory entry is flushed
+    after the renames.
+    """
+    output_dir = Path(output_dir)
+    staging = Path(tempfile.mkdtemp(prefix=".scribsidian-staging-", dir=output_dir))
+    backups = staging / ".backup"
+    committed = []  # (target, backup or None) for rollback
+
+    try:
+        # 1. Stage every note
+        for filename, content in notes.items():
+            _write_note(staging / filename, content)
+
+        if fsync:
+            _sync_files(staging / filename for filename in notes)
+
+        # 2. Move into place, keeping any file we overwrite for rollback
+        backups.mkdir()
+        for filename in notes:
+            target = output_dir / filename
+            backup = backups / filename
+            try:
+                os.replace(target, backup)
+            except FileNotFoundError:
+                backup = None
+            committed.append((target, backup))
+            os.replace(staging / filename, target)
+
+        if fsync:
+            _sync_directory(output_dir)
+
+    except BaseException:
+        for target, backup in reversed(committed):
+            try:
+                if backup is not None:
+                    os.replace(backup, target)
+                else:
+                    os.unlink(target)
+            except FileNotFoundError:
+                pass
+        raise
+
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def _write_note(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def write_notes_concurrently(notes, output_dir=".", jobs=4, progress=None, fsync=False):
+    """
+    Write a batch of rendered notes ({filename: content}) using a bounded
+    pool of `jobs` threads, for vaults where per-file I/O latency dominates
+    (slow disks, cloud-synced folders).
+
+    Files are byte-identical to the serial writers. A failing note does not
+    stop the others: the return value maps each failed filename to its
+    exception (empty dict on success). progress, if given, is called as
+    progress(done, total) after each file.
+
+    With fsync=True the written notes, and the directory entries of new
+    ones, are flushed to disk once the whole pool has finished.
+    """
+    output_dir = Path(output_dir)
+    total = len(notes)
+    errors = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = {
+            pool.submit(_write_note, output_dir / filename, content): filename
+            for filename, content in notes.items()
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            error = future.exception()
+            if error is not None:
+                errors[futures[future]] = error
+            if progress:
+                progress(done, total)
+
+    if fsync:
+        _sync_files(output_dir / filename for filename in notes if filename not in errors)
+        _sync_directory(output_dir)
+
+    return errors
+
+
+def _sync_files(paths):
+    """Flush staged files to disk: one os.sync() where available, else per file."""
+    if hasattr(os, "sync"):
+        os.sync()
+        return
+    for path in paths:
+        with open(path, "rb+") as f:
+            os.fsync(f.fileno())
+
+
+def _sync_directory(path):
+    """Flush a directory's entries (renames) to disk; a no-op where unsupported."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# --------------------------
+# Incremental Re-import
+# --------------------------
+
+# Lives in the output directory; maps note keys to what was last written
+IMPORT_MANIFEST = ".scribsidian-manifest.json"
+IMPORT_MANIFEST_VERSION = 1
+
+
+def quote_key(quote, metadata):
+    """Content hash identifying a quote across re-imports of the same source."""
+    data = f"{metadata['source_slug']}\0{quote['text']}".encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+
+def load_import_manifest(output_dir):
+    """
+    Load the import manifest from output_dir. A missing, unreadable or
+    outdated manifest yields an empty one, so the next run rewrites
+    everything rather than skipping notes it cannot vouch for.
+    """
+    try:
+        with open(Path(output_dir) / IMPORT_MANIFEST, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get("version") != IMPORT_MANIFEST_VERSION:
+        return {}
+    return manifest.get("notes", {})
+
+
+def save_import_manifest(output_dir, manifest):
+    """Atomically replace the import manifest in output_dir."""
+    path = Path(output_dir) / IMPORT_MANIFEST
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": IMPORT_MANIFEST_VERSION, "notes": manifest}, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def write_book_notes(keyed_notes, output_dir, manifest=None, jobs=1, fsync=False,
+                     force=False, progress=None, registry=None, stats=None):
+    """
+    Write one book's rendered notes (from render_keyed_notes()).
+
+    With an import manifest, notes whose rendered content matches what was
+    last written, and whose file is still there, are skipped, leaving the
+    file and any edits made to it alone; the manifest is updated in place
+    for every note written. A rewritten note keeps the related: links it
+    had (see link_related_quotes()), so runs without --related keep them. Without
+    one, or with force=True, every note is written. With a SlugRegistry,
+    quote filenames are first made collision-free (see assign_filenames()).
+    With a PipelineStats, notes written/unchanged and bytes written are counted.
+
+    Returns (written, skipped, errors) where errors maps filenames to
+    exceptions (the concurrent jobs > 1 path collects write failures; the
+    all-or-nothing path raises instead; either may collect a note whose
+    related: links could not be restored).
+    """
+    if registry is not None:
+        keyed_notes = assign_filenames(keyed_notes, registry, manifest)
+
+    def on_disk(filename):
+        # The registry's scan saves a stat per note
+        if registry is not None:
+            return filename[:-3] in registry.on_disk
+        return (Path(output_dir) / filename).exists()
+
+    notes = {}
+    entries = {}
+    skipped = 0
+
+    sizes = {}
+
+    for key, filename, content, info in keyed_notes:
+        data = content.encode("utf-8")
+        digest = hashlib.sha1(data).hexdigest()
+        recorded = manifest.get(key) if manifest is not None and not force else None
+        if (recorded and recorded.get("filename") == filename and recorded.get("sha1") == digest
+                and on_disk(filename)):
+            skipped += 1
+            continue
+        notes[filename] = content
+        sizes[filename] = len(data)
+        entries[key] = {"filename": filename, "sha1": digest, **info}
+
+    # Only link_related_quotes() changes these, so carry them over the rewrite
+    carried = {}
+    for filename in notes:
+        if on_disk(filename):
+            names = read_related_links(Path(output_dir) / filename)
+            if names:
+                carried[filename] = names
+
+    errors = {}
+    if notes:
+        if jobs > 1:
+            errors = write_notes_concurrently(
+                notes, output_dir, jobs=jobs, progress=progress, fsync=fsync
+            )
+        else:
+            write_notes_atomically(notes, output_dir, fsync=fsync)
+
+    for filename, names in carried.items():
+        if filename not in errors:
+            try:
+                write_related_links(Path(output_dir) / filename, names)
+            except OSError as e:
+                # Left out of the manifest, so the next run tries again
+                errors[filename] = e
+
+    if manifest is not None:
+        manifest.update(
+            (key, entry) for key, entry in entries.items() if entry["filename"] not in errors
+        )
+    if registry is not None:
+        registry.on_disk.update(filename[:-3] for filename in notes if filename not in errors)
+
+    if stats is not None:
+        stats.count("notes written", len(notes) - len(errors))
+        stats.count("notes unchanged", skipped)
+        stats.count("bytes written", sum(size for name, size in sizes.items() if name not in errors))
+
+    return len(notes) - len(errors), skipped, errors
+
+
+# --------------------------
+# Slug Registry (collision handling)
+# --------------------------
+
+class SlugRegistry:
+    """
+    Note names already used in an output directory, gathered with a single
+    directory scan so every collision check is a set lookup instead of a
+    stat per file.
+    """
+
+    def __init__(self, output_dir=None, names=()):
+        self.output_dir = Path(output_dir) if output_dir is not None else None
+        self.taken = set(names)
+        # Names with a file in output_dir: the scan, plus notes written since
+        self.on_disk = set(names)
+        self._next_suffix = {}
+
+    @classmethod
+    def scan(cls, output_dir):
+        """Build a registry from the .md files currently in output_dir."""
+        try:
+            with os.scandir(output_dir) as entries:
+                names = [e.name[:-3] for e in entries if e.name.endswith(".md")]
+        except FileNotFoundError:
+            names = []
+        return cls(output_dir, names)
+
+    def add(self, slug):
+        """Mark slug as used (e.g. shared author/source notes)."""
+        self.taken.add(slug)
+
+    def claim(self, slug, content=None):
+        """
+        Reserve a unique name for a new note and return it. If slug is free
+        it is used as is; otherwise the first free "slug-2", "slug-3", ...
+        is chosen. An existing file whose content is identical to `content`
+        is treated as the same note rather than a collision.
+        """
+        if slug in self.taken and content is not None and self._same_content(slug, content):
+            return slug
+
+        name = slug
+        n = self._next_suffix.get(slug, 2)
+        while name in self.taken:
+            name = f"{slug}-{n}"
+            n += 1
+        if name != slug:
+            self._next_suffix[slug] = n
+
+        self.taken.add(name)
+        return name
+
+    def _same_content(self, slug, content):
+        if self.output_dir is None:
+            return False
+        try:
+            with open(self.output_dir / f"{slug}.md") as f:
+                return f.read() == content
+        except OSError:
+            return False
+
+
+def assign_filenames(keyed_notes, registry, manifest=None):
+    """
+    Give every quote note in keyed_notes a collision-free filename.
+
+    Author and source notes keep their names (they are meant to be shared
+    between books), quotes already recorded in the import manifest keep
+    the file they were written to, and a quote repeated within the batch
+    reuses the name of its first occurrence. Everything else is claimed
+    from the registry.
+    """
+    assigned = {}
+    resolved = []
+
+    for key, filename, content, info in keyed_notes:
+        stem = filename[:-3]
+        if key in assigned:
+            filename = assigned[key]
+        elif key.startswith(("author:", "source:")):
+            registry.add(stem)
+        elif manifest and key in manifest:
+            filename = manifest[key]["filename"]
+            registry.add(filename[:-3])
+        else:
+            filename = f"{registry.claim(stem, content)}.md"
+        assigned[key] = filename
+        resolved.append((key, filename, content, info))
+
+    return resolved
+
+
+# --------------------------
+# Vault Tag Vocabulary
+# --------------------------
+
+# Per-file tags cached in the output directory, keyed by name with mtime/size
+TAG_VOCABULARY_CACHE = ".scribsidian-tags.json"
+TAG_VOCABULARY_VERSION = 1
+
+TAG_KEY_SEPARATORS = re.compile(r"[-_\s]+")
+
+
+def tag_key(tag):
+    """
+    Loose form of a tag used to spot near-duplicates: case, separators and
+    simple plurals are ignored ("Human_Attentions" ~ "human-attention").
+    """
+    words = TAG_KEY_SEPARATORS.split(tag.strip().lstrip("#").lower())
+    return "-".join(
+        w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+        for w in words if w
+    )
+
+
+def read_frontmatter_tags(path):
+    """
+    Tags from a note's YAML frontmatter, reading only up to its closing
+    "---". Handles block lists ("tags:" then "  - a") and inline lists
+    ("tags: [a, b]" or "tags: a, b").
+    """
+    tags = []
+    with open(path, encoding="utf-8", errors="replace") as f:
+        if f.readline().strip() != "---":
+            return tags
+        in_tags = False
+        for line in f:
+            stripped = line.strip()
+            if stripped == "---":
+                break
+            if in_tags and stripped.startswith("-"):
+                tag = stripped[1:].strip().strip("\"'")
+                if tag:
+                    tags.append(tag)
+                continue
+            in_tags = False
+            if stripped.startswith("tags:"):
+                value = stripped[5:].strip()
+                if value:
+                    tags.extend(t.strip().strip("\"'") for t in value.strip("[]").split(",") if t.strip())
+                else:
+                    in_tags = True
+    return tags
+
+
+class TagVocabulary:
+    """
+    Tags used across every note in the output directory.
+
+    scan() reads the frontmatter of each .md file once and caches the
+    result (with the file's mtime and size) in TAG_VOCABULARY_CACHE, so
+    later scans only re-read notes that changed. counts maps each tag to
+    the number of notes using it; canonical() maps a phrase onto an
+    existing tag with the same tag_key().
+    """
+
+    def __init__(self, files=None):
+        self.files = files or {}  # note name -> [mtime_ns, size, tags]
+        self.counts = Counter()
+        for _, _, tags in self.files.values():
+            self.counts.update(set(tags))
+        self.tags = frozenset(self.counts)
+
+        # Most used spelling wins when several tags share a key
+        self._by_key = {}
+        for tag, count in sorted(self.counts.items(), key=lambda x: (-x[1], x[0])):
+            self._by_key.setdefault(tag_key(tag), tag)
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __getstate__(self):
+        # Batch workers only need the tags, not the per-file scan state
+        state = dict(self.__dict__)
+        state["files"] = {}
+        return state
+
+    def canonical(self, phrase):
+        """The vault's spelling of phrase if an existing tag matches it loosely."""
+        if phrase in self.tags:
+            return phrase
+        return self._by_key.get(tag_key(phrase), phrase)
+
+    @classmethod
+    def scan(cls, output_dir):
+        """Index the tags of every note in output_dir, reusing the cache for unchanged files."""
+        output_dir = Path(output_dir)
+        cache_path = output_dir / TAG_VOCABULARY_CACHE
+
+        cached = {}
+        try:
+            with open(cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == TAG_VOCABULARY_VERSION:
+                cached = data.get("files", {})
+        except (OSError, ValueError, AttributeError):
+            pass
+
+        files = {}
+        changed = False
+        try:
+            with os.scandir(output_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".md") or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    previous = cached.get(entry.name)
+                    if previous and previous[0] == stat.st_mtime_ns and previous[1] == stat.st_size:
+                        files[entry.name] = previous
+                        continue
+                    try:
+                        tags = read_frontmatter_tags(entry.path)
+                    except OSError:
+                        continue
+                    files[entry.name] = [stat.st_mtime_ns, stat.st_size, tags]
+                    changed = True
+        except FileNotFoundError:
+            return cls()
+
+        if changed or len(files) != len(cached):
+            try:
+                tmp = cache_path.with_name(cache_path.name + ".tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump({"version": TAG_VOCABULARY_VERSION, "files": files}, f,
+                              separators=(",", ":"))
+                os.replace(tmp, cache_path)
+            except OSError:
+                pass
+
+        return cls(files)
+
+
+# --------------------------
+# Related Quotes
+# --------------------------
+
+# Phrase vectors and neighbour lists for every quote note, in the output directory
+RELATED_INDEX = ".scribsidian-related.json"
+RELATED_INDEX_VERSION = 1
+
+# Links per note, and the weakest cosine similarity worth linking
+RELATED_TOP_K = 5
+RELATED_MIN_SCORE = 0.1
+
+# Phrases found in more than this share of the vault's quotes (and more
+# than RELATED_DF_FLOOR of them) are ignored: they say little about
+# similarity and would dominate the work
+RELATED_MAX_DF = 0.02
+RELATED_DF_FLOOR = 100
+
+# Candidate (query, quote) pairs scored per NumPy step
+RELATED_BLOCK = 4_000_000
+
+
+def phrase_features(phrases):
+    """Hashed sparse vector of a quote's noun phrases: sorted CRC-32 feature ids."""
+    return sorted({zlib.crc32(p.encode("utf-8")) for p in phrases})
+
+
+def _expand_ranges(starts, counts):
+    """Concatenation of range(start, start + count) for each pair, vectorized."""
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(int(counts.sum()))
+
+
+class RelatedIndex:
+    """
+    Each quote note's hashed phrase vector and its RELATED_TOP_K most
+    similar quotes across the vault.
+
+    Similarity is the cosine of IDF-weighted binary phrase vectors. update()
+    scores only the quotes being added against the whole vault, through
+    an inverted index (batched NumPy, or pure Python without it), and
+    patches the neighbour lists of existing quotes that a new quote
+    displaces, so each new book costs time proportional to its own size
+    times the vault's, not the vault's squared.
+    """
+
+    def __init__(self, rows=()):
+        self.keys = []       # quote_key() per row
+        self.names = []      # note name (filename without .md) per row
+        self.features = []   # phrase_features() per row
+        self.neighbors = []  # [(score, row)] per row, best first
+        self.position = {}   # key -> row
+        for key, name, features, neighbors in rows:
+            self.position[key] = len(self.keys)
+            self.keys.append(key)
+            self.names.append(name)
+            self.features.append(features)
+            self.neighbors.append([tuple(n) for n in neighbors])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def related(self, row):
+        """Note names of row's neighbours, best first."""
+        return [self.names[r] for _, r in self.neighbors[row]]
+
+    def prune(self, names):
+        """
+        Drop rows whose key is not in names (key -> current note name) or
+        whose note has another name now, e.g. quotes whose notes were
+        deleted. Returns the keys of remaining rows that lost a neighbour,
+        to be passed to update() as rescore.
+        """
+        keep = [row for row, key in enumerate(self.keys) if names.get(key) == self.names[row]]
+        if len(keep) == len(self.keys):
+            return []
+
+        renumber = {row: i for i, row in enumerate(keep)}
+        rows = []
+        lost = []
+        for row in keep:
+            neighbors = [(score, renumber[r]) for score, r in self.neighbors[row] if r in renumber]
+            if len(neighbors) < len(self.neighbors[row]):
+                lost.append(self.keys[row])
+            rows.append((self.keys[row], self.names[row], self.features[row], neighbors))
+        self.__init__(rows)
+        return lost
+
+    def update(self, items, rescore=()):
+        """
+        Add or replace (key, note name, phrases) items and compute their
+        neighbours, and recompute those of the rows keyed in rescore.
+        Returns the set of rows whose neighbour lists changed (always
+        including every updated or rescored row).
+        """
+        queries = []
+        for key, name, phrases in items:
+            row = self.position.get(key)
+            if row is None:
+                row = self.position[key] = len(self.keys)
+                self.keys.append(key)
+                self.names.append(name)
+                self.features.append([])
+                self.neighbors.append([])
+            self.names[row] = name
+            self.features[row] = phrase_features(phrases)
+            queries.append(row)
+        queries.extend(self.position[key] for key in rescore if key in self.position)
+        queries = list(dict.fromkeys(queries))
+        if not queries:
+            return set()
+
+        score = self._score_numpy if np is not None else self._score_python
+        changed = set(queries)
+        query_set = changed.copy()
+        for row, top, reverse in score(queries):
+            self.neighbors[row] = top
+            for similarity, other in reverse:
+                if other not in query_set and self._offer(other, similarity, row):
+                    changed.add(other)
+        return changed
+
+    def _offer(self, row, similarity, candidate):
+        """Put candidate into row's neighbours if it ranks; True if the list changed."""
+        current = [n for n in self.neighbors[row] if n[1] != candidate]
+        if len(current) >= RELATED_TOP_K and similarity <= current[-1][0]:
+            return False
+        current.append((similarity, candidate))
+        current.sort(key=lambda n: (-n[0], n[1]))
+        self.neighbors[row] = current[:RELATED_TOP_K]
+        return True
+
+    def _thresholds(self):
+        """Score an existing row's neighbour must beat: its k-th best, or RELATED_MIN_SCORE."""
+        return [
+            n[-1][0] if len(n) >= RELATED_TOP_K else RELATED_MIN_SCORE
+            for n in self.neighbors
+        ]
+
+    def _score_python(self, queries):
+        """Yield (row, top neighbours, [(score, other row)] worth offering back)."""
+        df = Counter(f for features in self.features for f in features)
+        cutoff = max(RELATED_DF_FLOOR, RELATED_MAX_DF * len(self))
+        weights = {f: math.log(1 + len(self) / n) ** 2 for f, n in df.items() if n <= cutoff}
+
+        postings = {}
+        for row, features in enumerate(self.features):
+            for f in features:
+                if f in weights:
+                    postings.setdefault(f, []).append(row)
+        norms = [math.sqrt(sum(weights.get(f, 0.0) for f in features)) for features in self.features]
+        thresholds = self._thresholds()
+
+        for row in queries:
+            totals = Counter()
+            for f in self.features[row]:
+                weight = weights.get(f)
+                if weight:
+                    for other in postings[f]:
+                        totals[other] += weight
+            totals.pop(row, None)
+
+            scores = [
+                (total / (norms[row] * norms[other]), other)
+                for other, total in totals.items()
+            ]
+            scores = [s for s in scores if s[0] >= RELATED_MIN_SCORE]
+            top = heapq.nsmallest(RELATED_TOP_K, scores, key=lambda n: (-n[0], n[1]))
+            yield row, top, [s for s in scores if s[0] >= thresholds[s[1]]]
+
+    def _score_numpy(self, queries):
+        """Same as _score_python(), a block of queries at a time."""
+        n_rows = len(self)
+        lengths = np.fromiter(map(len, self.features), dtype=np.int64, count=n_rows)
+        features = np.fromiter(chain.from_iterable(self.features), dtype=np.int64,
+                               count=int(lengths.sum()))
+        entry_rows = np.repeat(np.arange(n_rows), lengths)
+
+        unique, columns, df = np.unique(features, return_inverse=True, return_counts=True)
+        cutoff = max(RELATED_DF_FLOOR, RELATED_MAX_DF * n_rows)
+        weights = np.where(df <= cutoff, np.log1p(n_rows / df) ** 2, 0.0)
+        norms = np.sqrt(np.bincount(entry_rows, weights=weights[columns], minlength=n_rows))
+        norms[norms == 0] = np.inf
+
+        # Inverted index: rows holding each feature column, in column order
+        kept = weights[columns] > 0
+        order = np.argsort(columns[kept], kind="stable")
+        posting_rows = entry_rows[kept][order]
+        posting_counts = np.bincount(columns[kept], minlength=len(unique))
+        posting_starts = np.cumsum(posting_counts) - posting_counts
+
+        row_starts = np.cumsum(lengths) - lengths
+        thresholds = np.array(self._thresholds(), dtype=np.float64)
+        is_query = np.zeros(n_rows, dtype=bool)
+        is_query[queries] = True
+
+        # Cut the queries into blocks of about RELATED_BLOCK candidate pairs
+        queries = np.asarray(queries)
+        row_pairs = np.bincount(entry_rows, weights=posting_counts[columns], minlength=n_rows)
+        pair_totals = np.cumsum(row_pairs[queries])
+        start = 0
+        while start < len(queries):
+            done = pair_totals[start - 1] if start else 0
+            end = max(start + 1, int(np.searchsorted(pair_totals, done + RELATED_BLOCK, "right")))
+            rows = queries[start:end]
+            start = end
+
+            # Every (query, other row) pair sharing a feature, summed per pair
+            entries = _expand_ranges(row_starts[rows], lengths[rows])
+            entry_columns = columns[entries]
+            counts = posting_counts[entry_columns]
+            others = posting_rows[_expand_ranges(posting_starts[entry_columns], counts)]
+            pairs = np.repeat(np.repeat(np.arange(len(rows)), lengths[rows]), counts) * n_rows + others
+            pairs, pair_ids = np.unique(pairs, return_inverse=True)
+            totals = np.bincount(pair_ids, weights=np.repeat(weights[entry_columns], counts),
+                                 minlength=len(pairs))
+
+            query, other = np.divmod(pairs, n_rows)
+            scores = totals / (norms[rows][query] * norms[other])
+            keep = (scores >= RELATED_MIN_SCORE) & (other != rows[query])
+            query, other, scores = query[keep], other[keep], scores[keep]
+
+            # Best first within each query, ties to the earlier row
+            order = np.lexsort((other, -scores, query))
+            query, other, scores = query[order], other[order], scores[order]
+            offers = ~is_query[other] & (scores >= thresholds[other])
+            firsts = np.searchsorted(query, np.arange(len(rows) + 1))
+
+            for i, row in enumerate(rows.tolist()):
+                first, last = firsts[i], firsts[i + 1]
+                cut = min(last, first + RELATED_TOP_K)
+                top = list(zip(scores[first:cut].tolist(), other[first:cut].tolist()))
+                offered = offers[first:last]
+                reverse = list(zip(scores[first:last][offered].tolist(),
+                                   other[first:last][offered].tolist()))
+                yield row, top, reverse
+
+    def save(self, output_dir):
+        """Write the index into output_dir as JSON (atomically)."""
+        path = Path(output_dir) / RELATED_INDEX
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": RELATED_INDEX_VERSION,
+                "rows": [
+                    [key, name, features, [[round(s, 4), r] for s, r in neighbors]]
+                    for key, name, features, neighbors
+                    in zip(self.keys, self.names, self.features, self.neighbors)
+                ],
+            }, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, output_dir):
+        """Load the index from output_dir; an empty one if missing, unreadable or outdated."""
+        try:
+            with open(Path(output_dir) / RELATED_INDEX, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls()
+        if not isinstance(data, dict) or data.get("version") != RELATED_INDEX_VERSION:
+            return cls()
+        return cls(data.get("rows", []))
+
+
+# One wikilink item of a note's related: block
+RELATED_LINK = re.compile(r'\s+-\s*"?\[\[(.+?)\]\]"?\s*$')
+
+
+def read_related_links(path):
+    """Note names in a note's related: block; empty if it has none or cannot be read."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().split("\n")
+    except (OSError, UnicodeDecodeError):
+        return []
+    if not lines or lines[0] != "---" or "---" not in lines[1:]:
+        return []
+
+    names = []
+    in_related = False
+    for line in lines[1:lines.index("---", 1)]:
+        if line.startswith("related:"):
+            in_related = True
+            continue
+        link = RELATED_LINK.match(line) if in_related else None
+        if link is None:
+            in_related = False
+            continue
+        names.append(link.group(1))
+    return names
+
+
+def write_related_links(path, names):
+    """
+    Replace the related: block in a note's frontmatter with wikilinks to
+    names, leaving the rest of the note (and any edits to it) alone.
+    Returns True if the file changed.
+    """
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().split("\n")
+    if not lines or lines[0] != "---" or "---" not in lines[1:]:
+        return False
+    end = lines.index("---", 1)
+
+    frontmatter = []
+    in_related = False
+    for line in lines[1:end]:
+        if line.startswith("related:"):
+            in_related = True
+            continue
+        if in_related and line.startswith("  -"):
+            continue
+        in_related = False
+        frontmatter.append(line)
+    if names:
+        frontmatter.append("related:")
+        frontmatter.extend(f'  - "[[{name}]]"' for name in names)
+
+    updated = ["---", *frontmatter, *lines[end:]]
+    if updated == lines:
+        return False
+    tmp = Path(path).with_name(Path(path).name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(updated))
+    os.replace(tmp, path)
+    return True
+
+
+def link_related_quotes(index, output_dir, quotes, metadata, manifest, phrases):
+    """
+    Add one book's written quotes (phrases[i] holds quotes[i]'s noun
+    phrases) to a RelatedIndex and rewrite the related: links of every note
+    whose neighbours changed, in this book or elsewhere in the vault.
+    manifest is the import manifest after writing, giving each quote's
+    note. Quotes whose note is no longer in the manifest or on disk are
+    pruned from the index first, and the notes that linked to them are
+    relinked. Returns the number of notes updated.
+    """
+    try:
+        with os.scandir(output_dir) as entries:
+            on_disk = {e.name[:-3] for e in entries if e.name.endswith(".md")}
+    except FileNotFoundError:
+        on_disk = set()
+    current = {}
+    for key, entry in manifest.items():
+        name = Path(entry.get("filename") or "").stem
+        if name in on_disk:
+            current[key] = name
+    rescore = index.prune(current)
+
+    items = []
+    for quote, quote_phrases in zip(quotes, phrases):
+        key = quote_key(quote, metadata)
+        entry = manifest.get(key)
+        if entry and entry.get("filename"):
+            items.append((key, Path(entry["filename"]).stem, quote_phrases))
+
+    updated = 0
+    for row in sorted(index.update(items, rescore)):
+        try:
+            updated += write_related_links(
+                Path(output_dir) / f"{index.names[row]}.md", index.related(row)
+            )
+        except OSError:
+            continue
+    return updated
+
+
+# --------------------------
+# Writing Pattern Classifier
+# --------------------------
+
+# Shipped next to this module
+PATTERN_TAXONOMY = Path(__file__).with_name("writing-patterns-taxonomy.yaml")
+
+# Compiled classifier, kept beside the parse cache; rebuilt whenever the
+# taxonomy's hash or this version changes
+PATTERN_ARTIFACT_NAME = "patterns.pickle"
+PATTERN_ARTIFACT_VERSION = 1
+
+# Words (with inner apostrophes) and colons; used for both markers and quotes
+PATTERN_TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)*|:")
+
+# Placeholders the taxonomy uses in templates like "It is ADJ to V"
+MARKER_PLACEHOLDERS = frozenset({"X", "Y", "V", "S", "NP", "NPs", "VP", "ADJ", "BE", "Aux", "SVO"})
+
+# Markers containing any of these describe a construction ("passive voice",
+# "question mark") rather than text that can be looked for
+DESCRIPTIVE_MARKER_WORDS = frozenset({
+    "address", "analysis", "articles", "attitude", "backshift", "callouts", "citation",
+    "citations", "cited", "claims", "clause", "colloquialisms", "compliments", "constructions",
+    "contractions", "credentials", "details", "evaluation", "examples", "facts", "form",
+    "identification", "imagery", "initial", "integration", "intonation", "language", "mark",
+    "markers", "mood", "narrative", "nominalization", "numbers", "oriented", "participle",
+    "percentages", "period", "person", "perspective", "placeholder", "polarity", "pronouns",
+    "questions", "quotations", "references", "retained", "screenshots", "sentences",
+    "separation", "shifts", "statements", "statistics", "steps", "stories", "stress",
+    "subject", "tag", "tensed", "termination", "terms", "verbs", "vocabulary", "voice", "wh",
+})
+
+# How many tokens may separate the two halves of a gapped marker ("so...that")
+PATTERN_GAP_TOKENS = 12
+
+
+def pattern_tokens(text):
+    """Lowercased tokens the classifier matches on (curly apostrophes folded)."""
+    return PATTERN_TOKEN.findall(text.lower().replace("’", "'"))
+
+
+def literal_markers(marker):
+    """
+    Token sequences to look for for one taxonomy marker. Each is a tuple of
+    one part, or of two parts that may be separated by a gap ("so...that").
+    Descriptive markers and templates with placeholders give [].
+    """
+    if not isinstance(marker, str):
+        return []
+    marker = marker.strip().rstrip(" ?.") if marker.endswith(("...", "?")) else marker.strip()
+    if not marker or marker.startswith("-") or marker.endswith("-"):
+        return []
+    if any(c in marker for c in "+(),[]"):
+        return []
+
+    # "too/also/so/either" lists alternatives; slashes inside phrases describe a category
+    if "/" in marker:
+        if " " in marker:
+            return []
+        alternatives = marker.split("/")
+    else:
+        alternatives = [marker]
+
+    results = []
+    for alternative in alternatives:
+        words = alternative.split()
+        if any(w.strip(":.") in MARKER_PLACEHOLDERS for w in words):
+            return []
+        if any(part in DESCRIPTIVE_MARKER_WORDS for w in words for part in w.lower().split("-")):
+            return []
+        parts = tuple(tuple(pattern_tokens(part)) for part in alternative.split("..."))
+        if len(parts) > 2 or not all(parts):
+            return []
+        results.append(parts)
+    return results
+
+
+def iter_taxonomy_markers(node):
+    """Yield (pattern id, name, marker) for every marker in a parsed taxonomy."""
+    if isinstance(node, dict):
+        if "id" in node and "markers" in node:
+            markers = node["markers"]
+            if isinstance(markers, dict):
+                for key, value in markers.items():
+                    if isinstance(value, list):
+                        for marker in value:
+                            yield node["id"], node.get("name", ""), marker
+                    else:
+                        # {marker: what it signals}, keys spelled like "you_know"
+                        yield node["id"], node.get("name", ""), str(key).replace("_", " ")
+            elif isinstance(markers, list):
+                for marker in markers:
+                    yield node["id"], node.get("name", ""), marker
+        for value in node.values():
+            yield from iter_taxonomy_markers(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from iter_taxonomy_markers(value)
+
+
+class PatternClassifier:
+    """
+    Annotates quotes with the IDs of writing patterns whose markers occur
+    in them.
+
+    Every literal marker in the taxonomy is compiled once into a token
+    trie: phrases maps a marker's tokens to the pattern IDs it signals and
+    prefixes holds each proper prefix, so classify() walks a quote's tokens
+    once and stops extending a match as soon as no marker continues it.
+    Gapped markers ("Not only...but") look for their tail a few tokens on.
+    """
+
+    def __init__(self, names=None, phrases=None, gapped=None, prefixes=None):
+        self.names = names or {}      # pattern id -> name
+        self.phrases = phrases or {}  # token tuple -> frozenset of pattern ids
+        self.gapped = gapped or {}    # head token tuple -> [(tail token tuple, ids)]
+        if prefixes is None:
+            prefixes = {
+                tokens[:n]
+                for tokens in (*self.phrases, *self.gapped)
+                for n in range(1, len(tokens))
+            }
+        self.prefixes = prefixes
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_taxonomy(cls, taxonomy):
+        """Compile a parsed taxonomy (the YAML document as dicts and lists)."""
+        names = {}
+        phrases = {}
+        gapped = {}
+        for pattern_id, name, marker in iter_taxonomy_markers(taxonomy):
+            for parts in literal_markers(marker):
+                names[pattern_id] = name
+                if len(parts) == 1:
+                    phrases.setdefault(parts[0], set()).add(pattern_id)
+                else:
+                    tails = gapped.setdefault(parts[0], {})
+                    tails.setdefault(parts[1], set()).add(pattern_id)
+        return cls(
+            names,
+            {tokens: frozenset(ids) for tokens, ids in phrases.items()},
+            {head: [(tail, frozenset(ids)) for tail, ids in tails.items()]
+             for head, tails in gapped.items()},
+        )
+
+    def classify(self, text):
+        """Sorted IDs of the patterns whose markers appear in text."""
+        tokens = pattern_tokens(text)
+        phrases, gapped, prefixes = self.phrases, self.gapped, self.prefixes
+        found = set()
+
+        for i in range(len(tokens)):
+            end = i + 1
+            while end <= len(tokens):
+                key = tuple(tokens[i:end])
+                ids = phrases.get(key)
+                if ids:
+                    found.update(ids)
+                for tail, tail_ids in gapped.get(key, ()):
+                    window = tokens[end:end + PATTERN_GAP_TOKENS + len(tail)]
+                    if any(tuple(window[j:j + len(tail)]) == tail for j in range(len(window))):
+                        found.update(tail_ids)
+                if key not in prefixes:
+                    break
+                end += 1
+
+        return sorted(found)
+
+    def annotate(self, quotes):
+        """Set quote["patterns"] on every quote."""
+        for q in quotes:
+            q["patterns"] = self.classify(q["text"])
+        return quotes
+
+
+def default_pattern_artifact_path():
+    """Compiled taxonomy file, in the same directory as the parse cache."""
+    return default_cache_path().with_name(PATTERN_ARTIFACT_NAME)
+
+
+def compile_pattern_taxonomy(path=PATTERN_TAXONOMY, artifact_path=None):
+    """
+    Compile the taxonomy at path (requires PyYAML) and save the classifier
+    to artifact_path, tagged with the taxonomy's hash. Returns the
+    classifier; the artifact is skipped if it cannot be written.
+    """
+    try:
+        import yaml
+    except ImportError:
+        raise ValueError("Writing-pattern annotation requires PyYAML: pip install pyyaml")
+
+    taxonomy_hash = file_hash(path)
+    with open(path, encoding="utf-8") as f:
+        classifier = PatternClassifier.from_taxonomy(yaml.safe_load(f))
+
+    artifact_path = Path(artifact_path or default_pattern_artifact_path())
+    try:
+        artifact_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = artifact_path.with_name(artifact_path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump({
+                "version": PATTERN_ARTIFACT_VERSION,
+                "taxonomy_hash": taxonomy_hash,
+                # Plain containers, so the artifact loads whatever module name this runs under
+                "state": vars(classifier),
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, artifact_path)
+    except OSError:
+        pass
+
+    return classifier
+
+
+def load_pattern_classifier(path=PATTERN_TAXONOMY, artifact_path=None):
+    """
+    The PatternClassifier for the taxonomy at path, unpickled from the
+    compiled artifact when it matches the taxonomy's current hash and
+    recompiled (and re-saved) otherwise.
+    """
+    artifact_path = Path(artifact_path or default_pattern_artifact_path())
+    try:
+        with open(artifact_path, "rb") as f:
+            data = pickle.load(f)
+        if (data.get("version") == PATTERN_ARTIFACT_VERSION
+                and data.get("taxonomy_hash") == file_hash(path)):
+            return PatternClassifier(**data["state"])
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError, TypeError,
+            ValueError):
+        pass
+    return compile_pattern_taxonomy(path, artifact_path)
+
+
 # --------------------------
 # Test Mode Data
 # --------------------------
@@ -307,97 +2936,554 @@ def tag_quotes_interactively(quotes):
     return quotes
 
 
+# --------------------------
+# Stage Instrumentation
+# --------------------------
+
+class PipelineStats:
+    """
+    Wall time per pipeline stage plus running counters (quotes parsed,
+    phrases extracted, bytes written...), cheap enough to collect on every
+    run. Stages keep the order they first ran in; timing the same stage
+    again adds to it.
+
+        stats = PipelineStats()
+        with stats.stage("parse"):
+            quotes = parse_quotes(raw)
+        stats.count("quotes parsed", len(quotes))
+    """
+
+    def __init__(self):
+        self.stages = {}         # stage name -> seconds
+        self.counters = Counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def rows(self):
+        """(label, value) pairs for display: stage times, the total, then counters."""
+        rows = [(name, f"{seconds:.3f}s") for name, seconds in self.stages.items()]
+        rows.append(("total", f"{sum(self.stages.values()):.3f}s"))
+        rows.extend((name, f"{value:,}") for name, value in self.counters.items())
+        return rows
+
+    def summary(self):
+        """Plain-text table of rows()."""
+        width = max(len(label) for label, _ in self.rows())
+        return "\n".join(f"  {label:<{width}}  {value:>10}" for label, value in self.rows())
+
+
+def run_profiled(func, stats_path, limit=15):
+    """
+    Call func() under cProfile, save the pstats data to stats_path and print
+    the most expensive calls by cumulative time.
+    """
+    import cProfile
+    import pstats
+
+    # Interactive mode changes directory before writing notes
+    stats_path = os.path.abspath(stats_path)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func)
+    finally:
+        profiler.dump_stats(stats_path)
+        print(f"\nProfile saved to {stats_path} (view with: python -m pstats {stats_path})")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(limit)
+
+
 # --------------------------
 # Main Program
 # --------------------------
 
-def main_simple(test_mode=False):
+def suggest_book_tags(quotes, metadata, output_dir=None, engine="frequency", cache_path=None,
+                      vocabulary=None, classifier=None):
+    """
+    Suggest tags for one book's quotes (see suggest_tags_for_all_quotes()),
+    the same way in every mode. Phrases are reused from the PhraseIndex
+    saved for this source in output_dir and, with cache_path, from the
+    ParseCache there. vocabulary, the vault's TagVocabulary, is scanned
+    from output_dir unless given; a PatternClassifier adds writing-pattern
+    IDs. Returns the PhraseIndex, for the caller to save.
+    """
+    previous = None
+    if output_dir is not None:
+        # Reuse phrases saved by an earlier import of this source
+        previous = PhraseIndex.load(phrase_index_path(output_dir, metadata))
+        if vocabulary is None:
+            # Prefer tags the vault already uses
+            vocabulary = TagVocabulary.scan(output_dir)
+
+    cache = open_parse_cache(cache_path) if cache_path is not None else None
+    try:
+        index = PhraseIndex.build(quotes, previous=previous, cache=cache)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    suggest_tags_for_all_quotes(quotes, engine=engine, index=index, vocabulary=vocabulary)
+    if classifier is not None:
+        classifier.annotate(quotes)
+    return index
+
+
+def choose_export_book(books):
+    """
+    Ask which of an export's books (see split_export_books()) to convert,
+    since one run writes one source. Returns that book's quotes.
+    """
+    print(f"\nThe export holds {len(books)} books:")
+    for number, (book, quotes) in enumerate(books, 1):
+        title, author = book or ("(untitled)", "")
+        by = f" ({author})" if author else ""
+        print(f"  {number}. {title}{by} - {len(quotes)} quotes")
+    print("Convert several at once with: python scribsidian.py batch\n")
+
+    while True:
+        choice = input(f"Book to convert [1-{len(books)}]: ").strip()
+        if choice.isdigit() and 1 <= int(choice) <= len(books):
+            return books[int(choice) - 1][1]
+        print("Please enter one of the numbers above.")
+
+
+def main_simple(test_mode=False, engine="frequency", fsync=False, jobs=1, full=False,
+                use_cache=True, classifier=None, stats=None, dedup=True, related=False):
     """
     Original simple CLI mode.
     Preserved with --simple flag for users who prefer the traditional interface.
+    With a PatternClassifier, quotes are annotated with writing-pattern IDs.
+    With dedup, near-duplicate highlights are merged or flagged before tagging.
+    With related, notes link to their most similar quotes across the vault.
+    Each numbered step is timed into stats (a PipelineStats), if given.
     """
+    if stats is None:
+        stats = PipelineStats()
 
     # -----------------------------------------
     # 1. Collect Highlights
     # -----------------------------------------
-    if test_mode:
-        print("Running in TEST MODE...")
-        raw_text = TEST_QUOTES
-    else:
-        print("Paste your Kindle highlights below.")
-        print("Press Return, then Ctrl-D when done.\n")
+    with stats.stage("parse"):
+        if test_mode:
+            print("Running in TEST MODE...")
+            quotes = parse_quotes(TEST_QUOTES)
+        else:
+            print("Paste your Kindle highlights below.")
+            print("Press Return, then Ctrl-D when done.\n")
 
-        raw_text = ""
-        try:
-            while True:
-                line = input()
-                raw_text += line + "\n"
-        except EOFError:
-            pass
+            # Stream stdin line by line instead of buffering the whole paste
+            books = split_export_books(sys.stdin)
+            quotes = [quote for _, quotes in books for quote in quotes]
+            if len(books) > 1:
+                quotes = choose_export_book(books)
 
-    quotes = parse_quotes(raw_text)
-    print(f"\nParsed {len(quotes)} quotes.\n")
+        stats.count("quotes parsed", len(quotes))
+        print(f"\nParsed {len(quotes)} quotes.\n")
+
+    # Page order, with highlights split across the export joined back up
+    with stats.stage("order"):
+        quotes, joined = order_quotes(quotes)
+        stats.count("split highlights joined", joined)
+        if joined:
+            print(f"Joined {joined} split highlights.\n")
 
     # -----------------------------------------
     # 2. Collect Metadata
     # -----------------------------------------
-    if test_mode:
-        metadata = TEST_METADATA.copy()
-        print("Using test metadata…")
-    else:
-        print("Enter source metadata:\n")
-
-        metadata = {
-            "title": input("Source title: ").strip(),
-            "author": input("Author: ").strip(),
-            "year": input("Year: ").strip(),
-            "publisher": input("Publisher: ").strip(),
-            "link": input("Link: ").strip(),
-            "citation": input("Citation (will be quoted safely): ").strip(),
-            "tags": [],
-            "format": "book"
-        }
+    with stats.stage("metadata"):
+        if test_mode:
+            metadata = TEST_METADATA.copy()
+            print("Using test metadata…")
+        else:
+            print("Enter source metadata:\n")
+
+            metadata = {
+                "title": input("Source title: ").strip(),
+                "author": input("Author: ").strip(),
+                "year": input("Year: ").strip(),
+                "publisher": input("Publisher: ").strip(),
+                "link": input("Link: ").strip(),
+                "citation": input("Citation (will be quoted safely): ").strip(),
+                "tags": [],
+                "format": "book"
+            }
+
+            tags_raw = input("Tags (comma separated): ").strip()
+            metadata["tags"] = [t.strip() for t in tags_raw.split(",")] if tags_raw else []
+
+        # --- Create Slugs for Linking ---
+        metadata["author_slug"] = slugify(metadata["author"])
+        metadata["source_slug"] = slugify(metadata["title"])
 
-        tags_raw = input("Tags (comma separated): ").strip()
-        metadata["tags"] = [t.strip() for t in tags_raw.split(",")] if tags_raw else []
+    # -----------------------------------------
+    # 3. Merge near-duplicate highlights
+    # -----------------------------------------
+    with stats.stage("dedup"):
+        if dedup:
+            output_dir = Path(DEFAULT_OUTPUT_DIR).resolve()
+            parsed = len(quotes)
+            quotes, signatures, merged, overlapping = merge_near_duplicates(quotes)
+            stats.count("near-duplicates merged", merged)
+            stats.count("partial overlaps kept", overlapping)
+
+            # Flag passages another book in the vault already has
+            flagged = 0
+            near_duplicates = open_near_duplicate_index(output_dir)
+            if near_duplicates is not None:
+                flagged = flag_near_duplicates(
+                    quotes, signatures, metadata, near_duplicates, load_import_manifest(output_dir)
+                )
+                near_duplicates.close()
+            stats.count("near-duplicates flagged", flagged)
+
+            if merged or flagged:
+                print(f"\nMerged {merged} of {parsed} highlights into longer ones; "
+                      f"{flagged} flagged as duplicates of existing notes.\n")
+            if overlapping:
+                print(f"Kept {overlapping} highlights that overlap a longer one but add text to it.\n")
 
-    # --- Create Slugs for Linking ---
-    metadata["author_slug"] = slugify(metadata["author"])
-    metadata["source_slug"] = slugify(metadata["title"])
+    # -----------------------------------------
+    # 4. Suggest tags for quotes (global + local)
+    # -----------------------------------------
+    with stats.stage("suggest"):
+        index = suggest_book_tags(
+            quotes, metadata, Path(DEFAULT_OUTPUT_DIR).resolve(), engine=engine,
+            cache_path=default_cache_path() if use_cache else None, classifier=classifier
+        )
+        stats.count("phrases extracted", sum(len(p) for p in index.quote_phrases))
 
     # -----------------------------------------
-    # 3. Suggest tags for quotes (global + local)
+    # 5. Tag quotes interactively
     # -----------------------------------------
-    suggest_tags_for_all_quotes(quotes)
+    with stats.stage("tag"):
+        if not test_mode:
+            quotes = tag_quotes_interactively(quotes)
+        else:
+            # In test mode, assign ALL suggested tags automatically
+            for q in quotes:
+                q["tags"] = q.get("suggested_tags", [])
+            print("\nAssigned suggested tags automatically (test mode).\n")
 
     # -----------------------------------------
-    # 4. Tag quotes interactively
+    # 6. Create Output Directory
     # -----------------------------------------
-    if not test_mode:
-        quotes = tag_quotes_interactively(quotes)
-    else:
-        # In test mode, assign ALL suggested tags automatically
-        for q in quotes:
-            q["tags"] = q.get("suggested_tags", [])
-        print("\nAssigned suggested tags automatically (test mode).\n")
+    with stats.stage("prepare output"):
+        output_dir = Path(DEFAULT_OUTPUT_DIR).resolve()
+        output_dir.mkdir(parents=True, exist_ok=True)
+        os.chdir(output_dir)
 
     # -----------------------------------------
-    # 5. Create Output Directory
+    # 7. Write Notes
     # -----------------------------------------
-    output_dir = Path("../../scribsidian_outputs").resolve()
-    output_dir.mkdir(parents=True, exist_ok=True)
-    os.chdir(output_dir)
+    with stats.stage("write"):
+        # Render everything first; unchanged notes from earlier imports are skipped
+        manifest = load_import_manifest(output_dir)
+        notes = render_keyed_notes(quotes, metadata)
+
+        def report(done, total):
+            print(f"\rWriting notes: {done}/{total}", end="", flush=True)
+
+        # jobs > 1 writes concurrently and reports failures per file instead of
+        # aborting; otherwise the batch is moved into place all-or-nothing
+        written, skipped, errors = write_book_notes(
+            notes, output_dir, manifest, jobs=jobs, fsync=fsync, force=full,
+            progress=report if jobs > 1 else None, registry=SlugRegistry.scan(output_dir),
+            stats=stats
+        )
+        if jobs > 1:
+            print()
+        for filename, error in errors.items():
+            print(f"❌ Failed to write {filename}: {error}")
+
+        save_import_manifest(output_dir, manifest)
+
+        index.save(phrase_index_path(output_dir, metadata))
 
     # -----------------------------------------
-    # 6. Write Notes
+    # 8. Link Related Quotes
     # -----------------------------------------
-    write_author_note(metadata)
-    write_source_note(metadata)
+    if related:
+        with stats.stage("related"):
+            related_index = RelatedIndex.load(output_dir)
+            linked = link_related_quotes(
+                related_index, output_dir, quotes, metadata, manifest, index.quote_phrases
+            )
+            related_index.save(output_dir)
+            stats.count("related links updated", linked)
+            print(f"\nUpdated related links in {linked} notes.")
+
+    print(f"\nWrote {written} notes, {skipped} unchanged.")
+    print(f"Done! Notes written to: {output_dir.resolve()}\n")
+
+
+# --------------------------
+# Batch Mode (headless)
+# --------------------------
+
+MANIFEST_FIELDS = ("title", "author", "year", "publisher", "link", "citation", "format")
+
+
+def load_manifest(path):
+    """
+    Load a batch metadata manifest: one entry per book, each with a "file"
+    key naming its export plus the usual metadata fields. Exports holding
+    several books (My Clippings.txt) can be listed once per book, with
+    "book" giving the title recorded in the export if it differs from
+    "title", or once with only "file" to import every book in them (see
+    expand_export_books()). Supports
+    .json (a list of objects), .csv (one row per book, comma-separated
+    tags) and .yaml/.yml (a list of mappings; requires PyYAML).
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+
+    with open(path, encoding="utf-8", newline="") as f:
+        if suffix == ".json":
+            entries = json.load(f)
+        elif suffix == ".csv":
+            entries = list(csv.DictReader(f))
+        elif suffix in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("YAML manifests require PyYAML: pip install pyyaml")
+            entries = yaml.safe_load(f)
+        else:
+            raise ValueError(f"Unsupported manifest format: {path.name} (use .json, .csv or .yaml)")
+
+    if not isinstance(entries, list):
+        raise ValueError(f"{path.name}: manifest must be a list of books")
+
+    return [_book_metadata(entry, i) for i, entry in enumerate(entries, start=1)]
+
+
+def _book_metadata(entry, position):
+    """Normalize one manifest entry into the metadata dict the writers expect."""
+    if not isinstance(entry, dict):
+        raise ValueError(f"Manifest entry {position} is not a mapping")
+
+    # Title and author may only be left out together, to be read from the export
+    required = ("file", "title", "author") if entry.get("title") or entry.get("author") else ("file",)
+    for field in required:
+        if not str(entry.get(field) or "").strip():
+            raise ValueError(f"Manifest entry {position} is missing {field!r}")
+
+    metadata = {field: str(entry.get(field) or "").strip() for field in MANIFEST_FIELDS}
+    metadata["format"] = metadata["format"] or "book"
+    metadata["file"] = str(entry["file"]).strip()
+    metadata["book"] = str(entry.get("book") or "").strip()
+
+    tags = entry.get("tags") or []
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    metadata["tags"] = [str(t).strip() for t in tags if str(t).strip()]
+
+    return metadata
+
+
+def expand_export_books(books, exports):
+    """
+    Replace each manifest entry that has no title with one entry per book
+    found in its export, titled and credited as the export records them.
+    exports maps each file to its read_export_books() result, or to the
+    exception reading it raised. Entries for such files, or for exports
+    that do not name their books, are kept as they are, to fail on their
+    own (see export_book_quotes()).
+    """
+    expanded = []
+    for metadata in books:
+        export = exports[metadata["file"]]
+        found = [] if isinstance(export, Exception) else [book for book, _ in export if book]
+        if metadata["title"] or not found:
+            expanded.append(metadata)
+            continue
+        for title, author in found:
+            # Kindle files authors as "Last, First"
+            last, comma, first = author.partition(",")
+            if comma and "," not in first and ";" not in author:
+                author = f"{first.strip()} {last.strip()}"
+            expanded.append(dict(metadata, title=title, author=author or "Unknown", book=title))
+    return expanded
+
+
+def export_book_quotes(metadata, exports):
+    """
+    Quotes of a manifest entry's book, from expand_export_books()'s exports.
+    Raises the error reading its export raised, or ValueError if the entry
+    cannot be matched to a book.
+    """
+    export = exports[metadata["file"]]
+    if isinstance(export, Exception):
+        raise export
+    if not metadata["title"]:
+        raise ValueError("the export does not name its book; give its manifest entry a title and author")
+    return select_export_book(export, metadata["book"] or metadata["title"])
+
+
+def process_book(quotes, metadata, engine="frequency", apply_tags=True, output_dir=None,
+                 cache_path=None, vocabulary=None, classifier=None, dedup=True, phrases=False):
+    """
+    Tag one book's parsed quotes. Runs inside a worker process, so it only
+    takes and returns picklable values: (quotes parsed, quotes kept,
+    metadata with slugs, MinHash signatures of the kept quotes or None,
+    number of partial overlaps kept, number of noun phrases found, each kept quote's noun phrases if phrases
+    is set, else None).
+    Quotes are put in page order first (see order_quotes()).
+    Tags are suggested as in the interactive modes (see suggest_book_tags()):
+    with output_dir, the book's PhraseIndex is reused and saved there; with
+    cache_path, phrases come from the ParseCache there. vocabulary is the
+    vault's TagVocabulary; classifier, a PatternClassifier, adds
+    writing-pattern IDs. With dedup, near-duplicate highlights are merged
+    before tagging.
+    """
+    quotes, _ = order_quotes(quotes)
+    parsed = len(quotes)
+    signatures = None
+    overlapping = 0
+    if dedup:
+        quotes, signatures, _, overlapping = merge_near_duplicates(quotes)
+
+    metadata = dict(metadata)
+    metadata["author_slug"] = slugify(metadata["author"])
+    metadata["source_slug"] = slugify(metadata["title"])
+
+    index = suggest_book_tags(
+        quotes, metadata, output_dir, engine=engine, cache_path=cache_path,
+        vocabulary=vocabulary, classifier=classifier
+    )
+    if output_dir is not None:
+        index.save(phrase_index_path(output_dir, metadata))
 
     for q in quotes:
-        write_quote_file(q, metadata)
+        q["tags"] = q["suggested_tags"] if apply_tags else []
+
+    phrase_count = sum(len(p) for p in index.quote_phrases)
+    return (parsed, quotes, metadata, signatures, overlapping, phrase_count,
+            index.quote_phrases if phrases else None)
 
-    print(f"\nDone! Notes written to: {output_dir.resolve()}\n")
+
+def main_batch(export_dir, manifest_path, output_dir=DEFAULT_OUTPUT_DIR, engine="frequency",
+               workers=None, apply_tags=True, fsync=False, jobs=1, full=False, use_cache=True,
+               classifier=None, stats=None, dedup=True, related=False):
+    """
+    Headless mode: convert every book listed in the manifest without prompts.
+    Exports are parsed, then books tagged, in parallel on a process pool
+    (workers processes, default one per CPU); each export is parsed once,
+    however many books it holds. Notes are written book by book in manifest
+    order, each as soon as it and the books before it are done, so colliding
+    note names get the same "-2", "-3" suffixes on every run.
+    Unchanged exports are served from the ParseCache unless use_cache is off.
+    With dedup, repeated highlights within a book are merged and quotes that
+    match a note from another book are flagged (see flag_near_duplicates()).
+    With related, notes link to their most similar quotes across the vault
+    (see link_related_quotes()), updated as each book is written.
+    Stage times and counters go into stats (a PipelineStats), if given.
+    Returns the number of books that failed.
+    """
+    if stats is None:
+        stats = PipelineStats()
+
+    with stats.stage("prepare"):
+        export_dir = Path(export_dir)
+        cache_path = default_cache_path() if use_cache else None
+        manifest = load_manifest(manifest_path)
+
+        output_dir = Path(output_dir).resolve()
+        output_dir.mkdir(parents=True, exist_ok=True)
+        import_manifest = load_import_manifest(output_dir)
+        registry = SlugRegistry.scan(output_dir)
+        vocabulary = TagVocabulary.scan(output_dir)
+        near_duplicates = open_near_duplicate_index(output_dir) if dedup else None
+        related_index = RelatedIndex.load(output_dir) if related else None
+
+    failures = 0
+
+    def report_failure(book, error):
+        nonlocal failures
+        failures += 1
+        source = f"{book['file']} ({book['title']})" if book["book"] else book["file"]
+        print(f"❌ {source}: {error}")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        with stats.stage("parse"):
+            futures = {
+                pool.submit(read_export_file, export_dir / name, cache_path): name
+                for name in dict.fromkeys(book["file"] for book in manifest)
+            }
+            exports = {}
+            for future in as_completed(futures):
+                try:
+                    exports[futures[future]] = future.result()
+                except Exception as e:
+                    exports[futures[future]] = e
+            books = expand_export_books(manifest, exports)
+
+        print(f"Converting {len(books)} books from {export_dir}...\n")
+
+        # Tagging happens in the workers, so this stage covers it and the
+        # writes together
+        with stats.stage("convert and write"):
+            futures = {}
+            for book in books:
+                try:
+                    quotes = export_book_quotes(book, exports)
+                except Exception as e:
+                    report_failure(book, e)
+                    continue
+                futures[pool.submit(
+                    process_book, quotes, book, engine, apply_tags, output_dir,
+                    cache_path, vocabulary, classifier, dedup, related
+                )] = book
+
+            # In manifest order, not completion order (see SlugRegistry.claim())
+            for future, book in futures.items():
+                try:
+                    (parsed, quotes, metadata, signatures, overlapping, phrase_count,
+                     phrases) = future.result()
+                    quote_count = len(quotes)
+                    stats.count("quotes parsed", parsed)
+                    stats.count("near-duplicates merged", parsed - quote_count)
+                    stats.count("partial overlaps kept", overlapping)
+                    if near_duplicates is not None and signatures is not None:
+                        stats.count("near-duplicates flagged", flag_near_duplicates(
+                            quotes, signatures, metadata, near_duplicates, import_manifest
+                        ))
+                    stats.count("phrases extracted", phrase_count)
+                    notes = render_keyed_notes(quotes, metadata)
+                    written, skipped, errors = write_book_notes(
+                        notes, output_dir, import_manifest, jobs=jobs, fsync=fsync, force=full,
+                        registry=registry, stats=stats
+                    )
+                    if errors:
+                        raise OSError(f"{len(errors)} notes could not be written, e.g. {next(iter(errors))}")
+                    if related_index is not None:
+                        stats.count("related links updated", link_related_quotes(
+                            related_index, output_dir, quotes, metadata, import_manifest, phrases
+                        ))
+                except Exception as e:
+                    report_failure(book, e)
+                    continue
+                merged = f", {parsed - quote_count} duplicates merged" if parsed > quote_count else ""
+                if overlapping:
+                    merged += f", {overlapping} partial overlaps kept"
+                print(f"✅ {book['title']}: {quote_count} quotes ({written} written, {skipped} unchanged{merged})")
+
+    with stats.stage("save manifest"):
+        save_import_manifest(output_dir, import_manifest)
+        if near_duplicates is not None:
+            near_duplicates.close()
+        if related_index is not None:
+            related_index.save(output_dir)
+
+    print(f"\nDone! {len(books) - failures}/{len(books)} books written to: {output_dir}\n")
+    return failures
 
 
 # --------------------------
@@ -413,11 +3499,77 @@ def main():
         python scribsidian.py --ui         # Launch TUI
         python scribsidian.py --test       # Simple CLI with test data
         python scribsidian.py --ui -t      # TUI with test data
+        python scribsidian.py --engine bm25  # Distinctive tag suggestions
+        python scribsidian.py -j 8         # Write notes with 8 threads
+        python scribsidian.py --patterns   # Annotate quotes with writing patterns
+        python scribsidian.py --related    # Link similar quotes across the vault
+        python scribsidian.py --profile    # Show where the time went
+        python scribsidian.py batch exports/ books.yaml   # Headless, many books
+        python scribsidian.py compile-patterns            # Prebuild the --patterns classifier
     """
     import argparse
 
+    def common_options(suppress=False):
+        """Options shared by the interactive modes and the batch command."""
+        unset = argparse.SUPPRESS if suppress else None
+        common = argparse.ArgumentParser(add_help=False, argument_default=unset)
+        common.add_argument(
+            "--engine",
+            choices=list(SCORING_ENGINES),
+            default=unset or "frequency",
+            help="Tag suggestion scoring (default: frequency)"
+        )
+        common.add_argument(
+            "--fsync",
+            action="store_true",
+            help="Flush written notes to disk before finishing"
+        )
+        common.add_argument(
+            "-j", "--jobs",
+            type=int,
+            default=unset or 1,
+            help="Write notes with N threads (default: 1, all-or-nothing)"
+        )
+        common.add_argument(
+            "--full",
+            action="store_true",
+            help="Rewrite every note instead of only new or changed ones"
+        )
+        common.add_argument(
+            "--no-cache",
+            action="store_true",
+            help="Do not read or write the parse cache"
+        )
+        common.add_argument(
+            "--profile",
+            action="store_true",
+            help="Print time spent per stage and counts of quotes, phrases and bytes written"
+        )
+        common.add_argument(
+            "--profile-stats",
+            metavar="FILE",
+            help="Also run under cProfile and save pstats data to FILE"
+        )
+        common.add_argument(
+            "--no-dedup",
+            action="store_true",
+            help="Keep near-duplicate highlights instead of merging or flagging them"
+        )
+        common.add_argument(
+            "--patterns",
+            action="store_true",
+            help="Add writing-pattern IDs from the taxonomy to quote frontmatter (requires PyYAML)"
+        )
+        common.add_argument(
+            "--related",
+            action="store_true",
+            help="Link each quote to its most similar quotes across the vault"
+        )
+        return common
+
     parser = argparse.ArgumentParser(
-        description="Scribsidian - Convert Kindle highlights to Obsidian notes"
+        description="Scribsidian - Convert Kindle highlights to Obsidian notes",
+        parents=[common_options()]
     )
     parser.add_argument(
         "--ui",
@@ -430,13 +3582,99 @@ def main():
         help="Load test data"
     )
 
+    subparsers = parser.add_subparsers(dest="command")
+    batch = subparsers.add_parser(
+        "batch",
+        # Given after "batch" they override the same options given before it;
+        # left out, they must not reset those to the defaults
+        parents=[common_options(suppress=True)],
+        help="Convert a directory of exports without prompts"
+    )
+    batch.add_argument("export_dir", help="Directory containing the export files")
+    batch.add_argument("manifest", help="Metadata manifest (.json, .csv or .yaml), one entry per book")
+    batch.add_argument(
+        "-o", "--output",
+        default=DEFAULT_OUTPUT_DIR,
+        help=f"Output directory (default: {DEFAULT_OUTPUT_DIR})"
+    )
+    batch.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=None,
+        help="Parallel processes for parsing and tagging (default: CPU count)"
+    )
+    batch.add_argument(
+        "--no-tags",
+        action="store_true",
+        help="Leave quote tags empty instead of applying suggestions"
+    )
+
+    compile_patterns = subparsers.add_parser(
+        "compile-patterns",
+        help="Precompile the writing-patterns taxonomy used by --patterns"
+    )
+    compile_patterns.add_argument(
+        "taxonomy",
+        nargs="?",
+        default=PATTERN_TAXONOMY,
+        help="Taxonomy YAML (default: the one shipped with Scribsidian)"
+    )
+
     args = parser.parse_args()
 
-    if args.ui:
+    if args.command == "compile-patterns":
+        artifact_path = default_pattern_artifact_path()
+        try:
+            classifier = compile_pattern_taxonomy(args.taxonomy, artifact_path)
+        except (OSError, ValueError) as e:
+            print(f"\n❌ Error: {e}")
+            sys.exit(1)
+        if not artifact_path.exists():
+            print(f"\n❌ Error: could not write {artifact_path}")
+            sys.exit(1)
+        print(f"Compiled {len(classifier)} patterns to {artifact_path}")
+        sys.exit(0)
+
+    classifier = None
+    if args.patterns:
+        try:
+            classifier = load_pattern_classifier()
+        except (OSError, ValueError) as e:
+            print(f"\n❌ Error: {e}")
+            sys.exit(1)
+
+    stats = PipelineStats()
+
+    def run(func, *func_args, **kwargs):
+        if args.profile_stats:
+            result = run_profiled(lambda: func(*func_args, **kwargs), args.profile_stats)
+        else:
+            result = func(*func_args, **kwargs)
+        if args.profile or args.profile_stats:
+            print("\nStage summary:")
+            print(stats.summary())
+        return result
+
+    if args.command == "batch":
+        try:
+            failures = run(
+                main_batch, args.export_dir, args.manifest, output_dir=args.output,
+                engine=args.engine, workers=args.workers, apply_tags=not args.no_tags,
+                fsync=args.fsync, jobs=args.jobs, full=args.full, use_cache=not args.no_cache,
+                classifier=classifier, stats=stats, dedup=not args.no_dedup,
+                related=args.related
+            )
+        except (OSError, ValueError) as e:
+            print(f"\n❌ Error: {e}")
+            sys.exit(1)
+        sys.exit(1 if failures else 0)
+    elif args.ui:
         # Run TUI mode
         try:
             from scribsidian_tui import run_tui
-            run_tui(test_mode=args.test)
+            run(run_tui, test_mode=args.test, engine=args.engine, fsync=args.fsync, jobs=args.jobs,
+                full=args.full, use_cache=not args.no_cache, classifier=classifier, stats=stats,
+                dedup=not args.no_dedup, related=args.related)
         except ImportError as e:
             print("\n❌ Error: Textual library not found!")
             print("Please install dependencies:")
@@ -446,7 +3684,9 @@ def main():
             sys.exit(1)
     else:
         # Run simple CLI mode (default)
-        main_simple(test_mode=args.test)
+        run(main_simple, test_mode=args.test, engine=args.engine, fsync=args.fsync, jobs=args.jobs,
+            full=args.full, use_cache=not args.no_cache, classifier=classifier, stats=stats,
+            dedup=not args.no_dedup, related=args.related)
 
 
 if __name__ == "__main__":
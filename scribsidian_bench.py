@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Scribsidian benchmarks
+Times hot paths against their previous implementations and checks that
+the output did not change, then runs each pipeline stage over synthetic
+Kindle exports and saves the timings as JSON for tracking regressions.
+
+Usage:
+    python scribsidian_bench.py                      # everything, 1k/10k/100k quotes
+    python scribsidian_bench.py --sizes 1000 10000   # smaller suite
+    python scribsidian_bench.py -o results.json      # where to save timings
+"""
+
+import json
+import platform
+import random
+import re
+import tempfile
+import time
+import timeit
+import tracemalloc
+import unicodedata
+
+from scribsidian import (
+    STOPWORDS,
+    Quote,
+    TEST_METADATA,
+    TEST_QUOTES,
+    extract_noun_phrases,
+    extract_noun_phrases_many,
+    np,
+    order_quotes,
+    parse_quotes,
+    render_all_notes,
+    slugify,
+    suggest_tags_for_all_quotes,
+    write_notes_atomically,
+    write_notes_concurrently,
+)
+
+
+# --------------------------
+# Reference Implementations
+# --------------------------
+
+def legacy_extract_noun_phrases(text):
+    """extract_noun_phrases() as it was before the compiled tokenizer."""
+    words = re.findall(r"[a-zA-Z\-']+", text.lower())
+
+    phrases = []
+    current = []
+
+    for w in words:
+        if w in STOPWORDS:
+            if len(current) > 0:
+                phrases.append(" ".join(current))
+                current = []
+        elif re.match(r"[a-z]+", w):
+            current.append(w)
+        else:
+            if len(current) > 0:
+                phrases.append(" ".join(current))
+                current = []
+
+    if current:
+        phrases.append(" ".join(current))
+
+    cleaned = []
+    for p in phrases:
+        p = p.strip()
+        if len(p) > 1:
+            cleaned.append(p.replace(" ", "-"))
+
+    return cleaned
+
+
+def legacy_slugify(text, max_length=60):
+    """slugify() as it was before caching and the ASCII fast path."""
+    text = unicodedata.normalize("NFKD", text)
+    text = text.lower()
+    text = re.sub(r'[^a-z0-9\s-]', '', text)
+    text = re.sub(r'\s+', '-', text)
+    return text[:max_length].rstrip('-')
+
+
+# --------------------------
+# Benchmarks
+# --------------------------
+
+def best_of(func, number, repeat=5):
+    """Best wall time in seconds for `number` calls of func."""
+    return min(timeit.repeat(func, number=number, repeat=repeat))
+
+
+def bench_extract_noun_phrases(copies=1000, number=5):
+    """Compare the legacy and compiled noun-phrase extractors on a book of quotes."""
+    texts = [q["text"] for q in parse_quotes(TEST_QUOTES)] * copies
+
+    expected = [legacy_extract_noun_phrases(t) for t in texts]
+    assert [extract_noun_phrases(t) for t in texts] == expected
+    assert extract_noun_phrases_many(texts) == expected
+
+    legacy = best_of(lambda: [legacy_extract_noun_phrases(t) for t in texts], number)
+    single = best_of(lambda: [extract_noun_phrases(t) for t in texts], number)
+    batch = best_of(lambda: extract_noun_phrases_many(texts), number)
+
+    print(f"extract_noun_phrases ({len(texts)} quotes x {number})")
+    print(f"  legacy:    {legacy:.4f}s")
+    print(f"  compiled:  {single:.4f}s  ({legacy / single:.2f}x)")
+    print(f"  batch:     {batch:.4f}s  ({legacy / batch:.2f}x)")
+
+
+def bench_slugify(books=2000, number=5):
+    """
+    Slug a batch run's worth of author/title names (heavily repeated) plus
+    quote openings, and check every slug matches the uncached version.
+    """
+    names = [
+        "James Williams", "Stand out of our Light", "Gabriel García Márquez",
+        "Cien años de soledad", "Ōe Kenzaburō", "Søren Kierkegaard",
+    ]
+    quotes = [q["text"][:80] for q in parse_quotes(TEST_QUOTES)]
+    texts = (names * (books // len(names))) + quotes * 100
+
+    for text in set(texts) | {"Ça va — naïve café", "  --Mixed  CASE\t\n", "ﬁ ligature ½", ""}:
+        assert slugify(text) == legacy_slugify(text), text
+        assert slugify(text, max_length=10) == legacy_slugify(text, max_length=10), text
+
+    legacy = best_of(lambda: [legacy_slugify(t) for t in texts], number)
+    cached = best_of(lambda: [slugify(t) for t in texts], number)
+    slugify.cache_clear()
+    uncached = best_of(lambda: [slugify.__wrapped__(t) for t in texts], number)
+
+    print(f"slugify ({len(texts)} names x {number})")
+    print(f"  legacy:    {legacy:.4f}s")
+    print(f"  fast path: {uncached:.4f}s  ({legacy / uncached:.2f}x)")
+    print(f"  cached:    {cached:.4f}s  ({legacy / cached:.2f}x)")
+
+
+def bench_quote_memory(count=100_000):
+    """
+    Memory held by count tagged quotes as the plain dicts the pipeline used
+    to pass around versus Quote objects. Texts are shared between the two;
+    tag strings are fresh copies per quote, as the extractor produces them.
+    """
+    quotes = parse_quotes(generate_export(count))
+    suggest_tags_for_all_quotes(quotes)
+    fields = [(q["page"], q["text"], q["suggested_tags"]) for q in quotes]
+    del quotes
+
+    def fresh(tags):
+        return ["".join(list(t)) for t in tags]
+
+    def held(build):
+        tracemalloc.start()
+        built = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        assert len(built) == count
+        return size
+
+    dicts = held(lambda: [
+        {"page": page, "text": text, "suggested_tags": fresh(tags), "tags": fresh(tags[:4])}
+        for page, text, tags in fields
+    ])
+    slotted = held(lambda: [
+        Quote(page, text, suggested_tags=fresh(tags), tags=fresh(tags[:4]))
+        for page, text, tags in fields
+    ])
+
+    print(f"quote memory ({count} tagged quotes, excluding text)")
+    print(f"  dicts:     {dicts / 1e6:7.1f} MB  ({dicts / count:.0f} B/quote)")
+    print(f"  Quote:     {slotted / 1e6:7.1f} MB  ({slotted / count:.0f} B/quote, {dicts / slotted:.2f}x smaller)")
+
+
+# --------------------------
+# Synthetic Exports
+# --------------------------
+
+# Vocabulary for generated highlights: the fixture's words plus enough
+# filler that phrases vary between quotes
+EXPORT_WORDS = sorted(set(re.findall(r"[a-z']+", TEST_QUOTES.lower())) - {"page", "highlight"} | {
+    "attention", "economy", "design", "freedom", "persuasion", "technology", "values",
+    "goals", "distraction", "metrics", "engagement", "choice", "autonomy", "willpower",
+    "advertising", "platform", "users", "habits", "reflection", "politics", "democracy",
+})
+
+ROMAN_NUMERALS = (
+    "i", "ii", "iii", "iv", "v", "vi", "vii", "viii", "ix", "x", "xi", "xii", "xiii", "xiv",
+    "xv", "xvi", "xvii", "xviii", "xix", "xx",
+)
+
+
+def generate_export(quote_count, seed=0, continued_rate=0.15, roman_rate=0.05):
+    """
+    A synthetic export in the "Page N | Highlight" format with quote_count
+    highlights. Front-matter highlights get roman-numeral pages, and about
+    continued_rate of the highlights are split across a page break with
+    Kindle's stray page-number line and a "Highlight Continued" header.
+    """
+    rng = random.Random(seed)
+    roman_count = int(quote_count * roman_rate)
+    out = []
+    page = 1
+    for i in range(quote_count):
+        if i < roman_count:
+            label = ROMAN_NUMERALS[i * len(ROMAN_NUMERALS) // roman_count]
+        else:
+            page += rng.randint(0, 3)
+            label = str(page)
+
+        words = rng.choices(EXPORT_WORDS, k=rng.randint(12, 70))
+        lines = [" ".join(words[j:j + 14]) for j in range(0, len(words), 14)]
+
+        out.append(f"Page {label} | Highlight")
+        if len(lines) > 1 and rng.random() < continued_rate:
+            split = rng.randint(1, len(lines) - 1)
+            out.extend(lines[:split])
+            out.append(str(rng.randint(1, 400)))
+            out.append(f"Page {label} | Highlight Continued")
+            out.extend(lines[split:])
+        else:
+            out.extend(lines)
+        out.append("")
+    return "\n".join(out) + "\n"
+
+
+# --------------------------
+# Pipeline Suite
+# --------------------------
+
+def timed(func, repeat=1):
+    """(result of the last call, best wall time in seconds over repeat calls)."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def bench_pipeline(quote_count, seed=0):
+    """
+    Time each stage of an import of quote_count synthetic quotes. Returns
+    a list of {"quotes", "stage", "seconds"} records.
+    """
+    raw = generate_export(quote_count, seed=seed)
+    repeat = 3 if quote_count <= 10_000 else 1
+    results = []
+
+    def report(stage, seconds):
+        results.append({"quotes": quote_count, "stage": stage, "seconds": round(seconds, 6)})
+        print(f"  {stage:<24} {seconds:9.4f}s  ({seconds / quote_count * 1e6:8.2f} µs/quote)")
+
+    def record(stage, func):
+        value, seconds = timed(func, repeat)
+        report(stage, seconds)
+        return value
+
+    print(f"pipeline ({quote_count} quotes, {len(raw) / 1e6:.1f} MB export)")
+
+    quotes = record("parse_quotes", lambda: parse_quotes(raw))
+    assert len(quotes) == quote_count, (len(quotes), quote_count)
+    record("order_quotes", lambda: order_quotes(quotes))
+    texts = [q["text"] for q in quotes]
+
+    record("extract_noun_phrases", lambda: [extract_noun_phrases(t) for t in texts])
+    for engine in ("frequency", "tfidf", "bm25"):
+        record(f"suggest_tags[{engine}]",
+               lambda: suggest_tags_for_all_quotes([dict(q) for q in quotes], engine=engine))
+
+    openings = [t[:80] for t in texts]
+
+    def slug_all():
+        slugify.cache_clear()
+        return [slugify(t) for t in openings]
+
+    record("slugify", slug_all)
+
+    suggest_tags_for_all_quotes(quotes)
+    for q in quotes:
+        q["tags"] = q["suggested_tags"][:4]
+    metadata = dict(TEST_METADATA)
+    metadata["author_slug"] = slugify(metadata["author"])
+    metadata["source_slug"] = slugify(metadata["title"])
+    notes = record("render_notes", lambda: render_all_notes(quotes, metadata))
+
+    # Each write goes to a fresh directory so every run creates the files
+    def write_fresh(writer, **kwargs):
+        with tempfile.TemporaryDirectory() as out:
+            start = time.perf_counter()
+            writer(notes, out, **kwargs)
+            return time.perf_counter() - start
+
+    for stage, writer, kwargs in (
+        ("write_notes_atomically", write_notes_atomically, {}),
+        ("write_notes_concurrently", write_notes_concurrently, {"jobs": 8}),
+    ):
+        report(stage, min(write_fresh(writer, **kwargs) for _ in range(repeat)))
+
+    return results
+
+
+def run_suite(sizes=(1_000, 10_000, 100_000), output="scribsidian-bench.json"):
+    """Run bench_pipeline() at each size and save every timing to output as JSON."""
+    results = []
+    for size in sizes:
+        results.extend(bench_pipeline(size))
+        print()
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__ if np is not None else None,
+        "results": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {len(results)} timings to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Scribsidian benchmarks")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000],
+        help="Synthetic export sizes in quotes (default: 1000 10000 100000)"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        default="scribsidian-bench.json",
+        help="JSON file for the pipeline timings (default: scribsidian-bench.json)"
+    )
+    parser.add_argument(
+        "--no-micro",
+        action="store_true",
+        help="Skip the comparisons against the legacy implementations"
+    )
+    args = parser.parse_args()
+
+    if not args.no_micro:
+        bench_extract_noun_phrases()
+        bench_slugify()
+        bench_quote_memory()
+        print()
+    run_suite(args.sizes, args.output)
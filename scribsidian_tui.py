@@ -4,6 +4,7 @@ Scribsidian TUI - Terminal User Interface for Kindle to Obsidian conversion
 Built with Textual framework
 """
 
+from textual import work
 from textual.app import App, ComposeResult
 from textual.containers import Container, Vertical, Horizontal, ScrollableContainer
 from textual.widgets import (
@@ -12,39 +13,37 @@ from textual.widgets import (
 )
 from textual.binding import Binding
 from textual.screen import Screen
+from bisect import bisect_left, bisect_right
 from pathlib import Path
 import os
 
 # Import existing functionality from scribsidian
 from scribsidian import (
-    parse_quotes,
-    suggest_tags_for_all_quotes,
-    write_quote_file,
-    write_author_note,
-    write_source_note,
+    IncrementalQuoteParser,
+    order_quotes,
+    page_sort_key,
+    suggest_book_tags,
+    PhraseIndex,
+    phrase_index_path,
+    default_cache_path,
+    PatternClassifier,
+    PipelineStats,
+    merge_near_duplicates,
+    open_near_duplicate_index,
+    flag_near_duplicates,
+    RelatedIndex,
+    link_related_quotes,
+    render_keyed_notes,
+    write_book_notes,
+    load_import_manifest,
+    save_import_manifest,
+    SlugRegistry,
     slugify,
+    DEFAULT_OUTPUT_DIR,
     TEST_QUOTES,
     TEST_METADATA
 )
 
-import re
-
-
-def sanitize_id(text: str) -> str:
-    """Sanitize text to create valid HTML/CSS IDs.
-
-    IDs must contain only letters, numbers, underscores, or hyphens,
-    and must not begin with a number.
-    """
-    # Replace invalid characters with underscores
-    sanitized = re.sub(r"[^a-zA-Z0-9_-]", "_", text)
-
-    # Ensure it doesn't start with a number
-    if sanitized and sanitized[0].isdigit():
-        sanitized = f"tag_{sanitized}"
-
-    return sanitized
-
 
 # --------------------------
 # Screen 1: Welcome
@@ -175,10 +174,15 @@ class QuoteInputScreen(Screen):
     }
     """
 
+    # Seconds of typing inactivity before the quote count is refreshed
+    COUNT_DEBOUNCE = 0.3
+
     def __init__(self, test_mode: bool = False):
         super().__init__()
         self.test_mode = test_mode
         self.quotes = []
+        self.parser = IncrementalQuoteParser()
+        self._count_timer = None
 
     def compose(self) -> ComposeResult:
         yield Container(
@@ -218,23 +222,54 @@ class QuoteInputScreen(Screen):
             self.update_quote_count()
 
     def on_text_area_changed(self, event: TextArea.Changed) -> None:
-        """Update quote count as user types."""
-        self.update_quote_count()
+        """Refresh the quote count once the user pauses typing."""
+        if self._count_timer is not None:
+            self._count_timer.stop()
+        self._count_timer = self.set_timer(self.COUNT_DEBOUNCE, self.schedule_quote_count)
+
+    def schedule_quote_count(self) -> None:
+        """Hand the current text to a background parse."""
+        self._count_timer = None
+        self.count_quotes_in_background(self.query_one("#quote-area", TextArea).text)
+
+    @work(thread=True, exclusive=True, group="quote-count")
+    def count_quotes_in_background(self, raw_text: str) -> None:
+        """Re-parse only the edited region off the event loop."""
+        count = self.parser.update(raw_text)
+        self.app.call_from_thread(self.show_quote_count, count)
 
     def update_quote_count(self) -> None:
         """Parse and count quotes from text area."""
         text_area = self.query_one("#quote-area", TextArea)
-        raw_text = text_area.text
+        self.show_quote_count(self.parser.update(text_area.text))
 
-        self.quotes = parse_quotes(raw_text)
+    def show_quote_count(self, count: int) -> None:
         count_widget = self.query_one("#quote-count", Static)
-        count_widget.update(f"📋 Detected quotes: {len(self.quotes)}")
+        count_widget.update(f"📋 Detected quotes: {count}")
 
     def on_button_pressed(self, event: Button.Pressed) -> None:
         if event.button.id == "continue-btn":
+            # Catch up with any edit still waiting for the debounce timer
+            with self.app.stats.stage("parse"):
+                self.update_quote_count()
+                self.quotes = self.parser.quotes()
+            # Set rather than added: the user may come back and edit the paste
+            self.app.stats.counters["quotes parsed"] = len(self.quotes)
+            with self.app.stats.stage("order"):
+                self.quotes, joined = order_quotes(self.quotes)
+            self.app.stats.counters["split highlights joined"] = joined
+
             if len(self.quotes) == 0:
                 self.notify("Please paste some Kindle highlights first", severity="warning")
                 return
+            if len(self.parser.books) > 1:
+                # One run writes one source; batch mode splits exports per book
+                self.notify(
+                    f"These clippings span {len(self.parser.books)} books. Paste one book's "
+                    "clippings, or convert them all with: scribsidian.py batch",
+                    severity="warning"
+                )
+                return
 
             # Pass quotes to next screen
             self.app.push_screen(MetadataScreen(self.quotes, self.test_mode))
@@ -393,15 +428,50 @@ class MetadataScreen(Screen):
             metadata["author_slug"] = slugify(metadata["author"])
             metadata["source_slug"] = slugify(metadata["title"])
 
+            stats = self.app.stats
+            if self.app.dedup:
+                self.merge_duplicates(metadata)
+
             # Generate tag suggestions for all quotes
-            suggest_tags_for_all_quotes(self.quotes)
+            with stats.stage("suggest"):
+                index = suggest_book_tags(
+                    self.quotes, metadata, Path(DEFAULT_OUTPUT_DIR).resolve(),
+                    engine=self.app.tag_engine,
+                    cache_path=default_cache_path() if self.app.use_cache else None,
+                    classifier=self.app.classifier
+                )
+            stats.counters["phrases extracted"] = sum(len(p) for p in index.quote_phrases)
 
             # Move to tagging screen
-            self.app.push_screen(TagQuotesScreen(self.quotes, metadata))
+            self.app.push_screen(TagQuotesScreen(self.quotes, metadata, index))
 
         elif event.button.id == "back-btn":
             self.app.pop_screen()
 
+    def merge_duplicates(self, metadata: dict) -> None:
+        """Merge repeated highlights and flag ones already in the vault, before tagging."""
+        stats = self.app.stats
+        with stats.stage("dedup"):
+            output_dir = Path(DEFAULT_OUTPUT_DIR).resolve()
+            self.quotes, signatures, merged, overlapping = merge_near_duplicates(self.quotes)
+            flagged = 0
+            near_duplicates = open_near_duplicate_index(output_dir)
+            if near_duplicates is not None:
+                flagged = flag_near_duplicates(
+                    self.quotes, signatures, metadata, near_duplicates,
+                    load_import_manifest(output_dir)
+                )
+                near_duplicates.close()
+        stats.counters["near-duplicates merged"] = merged
+        stats.counters["partial overlaps kept"] = overlapping
+        stats.counters["near-duplicates flagged"] = flagged
+        if merged or flagged or overlapping:
+            self.notify(
+                f"Merged {merged} repeated highlights; "
+                f"{flagged} flagged as duplicates of existing notes; "
+                f"{overlapping} kept that overlap a longer one"
+            )
+
 
 # --------------------------
 # Screen 4: Tag Quotes
@@ -414,6 +484,7 @@ class TagQuotesScreen(Screen):
         Binding("escape", "app.pop_screen", "Back"),
         Binding("n", "next_quote", "Next", show=True),
         Binding("p", "prev_quote", "Previous", show=True),
+        Binding("b", "bulk_tag", "Bulk Tag", show=True),
     ]
 
     CSS = """
@@ -508,10 +579,11 @@ class TagQuotesScreen(Screen):
     }
     """
 
-    def __init__(self, quotes: list, metadata: dict):
+    def __init__(self, quotes: list, metadata: dict, index: PhraseIndex = None):
         super().__init__()
         self.quotes = quotes
         self.metadata = metadata
+        self.index = index if index is not None else PhraseIndex.build(quotes)
         self.current_index = 0
 
         # Initialize tags list for each quote
@@ -519,6 +591,13 @@ class TagQuotesScreen(Screen):
             if "tags" not in q:
                 q["tags"] = []
 
+        # One checkbox per suggestion slot, reused for every quote
+        pool_size = max((len(q.get("suggested_tags", [])) for q in self.quotes), default=0)
+        self.checkbox_pool = [Checkbox("", id=f"tag-slot-{i}") for i in range(pool_size)]
+
+        # Display state prepared ahead of time, keyed by quote index
+        self._prepared = {}
+
     def compose(self) -> ComposeResult:
         yield Container(
             Static(f"Step 3/5: Tag Quotes (1/{len(self.quotes)})", id="step-header", classes="step-title"),
@@ -534,6 +613,7 @@ class TagQuotesScreen(Screen):
             Container(
                 Static("✨ Suggested Tags (select relevant ones):", classes="section-title"),
                 ScrollableContainer(
+                    *self.checkbox_pool,
                     id="checkboxes-container"
                 ),
                 Container(
@@ -547,9 +627,10 @@ class TagQuotesScreen(Screen):
         )
 
         yield Container(
-            Static("Press 'n' for next, 'p' for previous, or use buttons below.", id="instructions"),
+            Static("Press 'n' for next, 'p' for previous, 'b' to bulk tag, or use buttons below.", id="instructions"),
             Horizontal(
                 Button("← Back", variant="default", id="back-btn"),
+                Button("Bulk Tag ⊞", variant="default", id="bulk-btn"),
                 Button("Skip All →", variant="default", id="skip-btn"),
                 Button("Continue →", variant="primary", id="continue-btn"),
                 id="button-row"
@@ -561,51 +642,57 @@ class TagQuotesScreen(Screen):
         """Display first quote."""
         self.display_quote()
 
+    def prepare_quote(self, index: int) -> dict:
+        """Work out everything display_quote() needs for a quote."""
+        quote = self.quotes[index]
+        suggested_tags = quote.get("suggested_tags", [])
+        existing_tags = quote.get("tags", [])
+        custom_tags = [t for t in existing_tags if t not in suggested_tags]
+
+        return {
+            "header": f"Step 3/5: Tag Quotes ({index + 1}/{len(self.quotes)})",
+            "text": f'"{quote["text"]}"',
+            "meta": f"— Page {quote['page']}",
+            "tags": [(tag, tag in existing_tags) for tag in suggested_tags],
+            "custom": ", ".join(custom_tags) if custom_tags else "",
+        }
+
     def display_quote(self) -> None:
         """Display the current quote and its suggested tags."""
         if not self.quotes:
             return
 
-        quote = self.quotes[self.current_index]
-
-        # Update header
-        step_header = self.query_one("#step-header", Static)
-        step_header.update(f"Step 3/5: Tag Quotes ({self.current_index + 1}/{len(self.quotes)})")
-
-        # Update quote display
-        quote_text = self.query_one("#quote-text", Static)
-        quote_text.update(f'"{quote["text"]}"')
+        state = self._prepared.pop(self.current_index, None) or self.prepare_quote(self.current_index)
 
-        quote_meta = self.query_one("#quote-meta", Static)
-        quote_meta.update(f"— Page {quote['page']}")
+        # Update header and quote display
+        self.query_one("#step-header", Static).update(state["header"])
+        self.query_one("#quote-text", Static).update(state["text"])
+        self.query_one("#quote-meta", Static).update(state["meta"])
 
-        # Clear existing checkboxes
-        checkbox_container = self.query_one("#checkboxes-container", ScrollableContainer)
-        checkbox_container.remove_children()
+        # Relabel the pooled checkboxes in place; hide the unused slots
+        for i, checkbox in enumerate(self.checkbox_pool):
+            if i < len(state["tags"]):
+                checkbox.label, checkbox.value = state["tags"][i]
+                checkbox.display = True
+            else:
+                checkbox.display = False
+                checkbox.value = False
 
-        # Create checkboxes for suggested tags
-        suggested_tags = quote.get("suggested_tags", [])
-        existing_tags = quote.get("tags", [])
+        # Show existing custom tags not in suggestions
+        self.query_one("#custom-tags-input", Input).value = state["custom"]
 
-        for tag in suggested_tags:
-            # Sanitize tag for use in ID (avoid special characters like apostrophes)
-            safe_id = sanitize_id(f"tag-{tag}")
-            checkbox = Checkbox(tag, value=(tag in existing_tags), id=safe_id)
-            checkbox_container.mount(checkbox)
-
-        # Clear custom tags input (or show existing custom tags not in suggestions)
-        custom_input = self.query_one("#custom-tags-input", Input)
-        custom_tags = [t for t in existing_tags if t not in suggested_tags]
-        custom_input.value = ", ".join(custom_tags) if custom_tags else ""
+        # Preload the quote the user is most likely to open next
+        next_index = self.current_index + 1
+        if next_index < len(self.quotes):
+            self._prepared[next_index] = self.prepare_quote(next_index)
 
     def collect_current_tags(self) -> None:
         """Collect selected tags for current quote."""
         quote = self.quotes[self.current_index]
         tags = []
 
-        # Collect checked tags
-        checkboxes = self.query(Checkbox)
-        for cb in checkboxes:
+        # Collect checked tags from the slots in use
+        for cb in self.checkbox_pool[:len(quote.get("suggested_tags", []))]:
             if cb.value and cb.label:
                 tag_text = str(cb.label).strip()
                 if tag_text:
@@ -648,13 +735,26 @@ class TagQuotesScreen(Screen):
         else:
             self.notify("First quote reached", severity="information")
 
+    def action_bulk_tag(self) -> None:
+        """Open the table view for tagging many quotes at once."""
+        self.collect_current_tags()
+        self.app.push_screen(BulkTagScreen(self.quotes, self.index))
+
+    def on_screen_resume(self) -> None:
+        """Tags may have changed in the bulk view; redraw the current quote."""
+        self._prepared.clear()
+        self.display_quote()
+
     def on_button_pressed(self, event: Button.Pressed) -> None:
-        if event.button.id == "continue-btn":
+        if event.button.id == "bulk-btn":
+            self.action_bulk_tag()
+
+        elif event.button.id == "continue-btn":
             # Save current quote's tags
             self.collect_current_tags()
 
             # Move to review screen
-            self.app.push_screen(ReviewScreen(self.quotes, self.metadata))
+            self.app.push_screen(ReviewScreen(self.quotes, self.metadata, self.index))
 
         elif event.button.id == "skip-btn":
             # Skip tagging - leave all tags empty
@@ -662,13 +762,238 @@ class TagQuotesScreen(Screen):
                 if "tags" not in quote or not quote["tags"]:
                     quote["tags"] = []
 
-            self.app.push_screen(ReviewScreen(self.quotes, self.metadata))
+            self.app.push_screen(ReviewScreen(self.quotes, self.metadata, self.index))
 
         elif event.button.id == "back-btn":
             self.collect_current_tags()
             self.app.pop_screen()
 
 
+# --------------------------
+# Screen 4b: Bulk Tagging
+# --------------------------
+
+class BulkTagScreen(Screen):
+    """Table of all quotes for filtering, multi-selecting and tagging in bulk."""
+
+    BINDINGS = [
+        Binding("escape", "app.pop_screen", "Back"),
+    ]
+
+    CSS = """
+    BulkTagScreen {
+        layout: vertical;
+    }
+
+    #header-box {
+        height: 4;
+        border: solid $primary;
+        padding: 1 2;
+        background: $surface;
+    }
+
+    .step-title {
+        text-style: bold;
+        color: $accent;
+    }
+
+    #filter-input {
+        margin: 1 2 0 2;
+    }
+
+    #quote-table {
+        height: 1fr;
+        margin: 1 2;
+        border: solid $primary;
+    }
+
+    #footer-box {
+        height: 9;
+        border: solid $primary;
+        padding: 1 2;
+        background: $surface;
+    }
+
+    #button-row {
+        align: center middle;
+        height: auto;
+        width: 100%;
+        margin-top: 1;
+    }
+
+    Button {
+        margin: 0 1;
+    }
+    """
+
+    # Quote text is cut to this many characters in the table
+    PREVIEW_LENGTH = 80
+
+    def __init__(self, quotes: list, index: PhraseIndex):
+        super().__init__()
+        self.quotes = quotes
+        self.index = index
+        self.selected = set()
+        self.shown = list(range(len(quotes)))
+        self.build_filter_index()
+
+    def build_filter_index(self) -> None:
+        """Index quotes once by suggested tag and page (phrases come from the PhraseIndex)."""
+        self.suggested_index = {}
+        pages = []
+
+        for i, quote in enumerate(self.quotes):
+            for tag in quote.get("suggested_tags", []):
+                self.suggested_index.setdefault(tag, set()).add(i)
+            # Roman front-matter pages sort before arabic ones (see page_sort_key())
+            pages.append((page_sort_key(quote["page"]), i))
+
+        pages.sort()
+        self.page_keys = [page for page, _ in pages]
+        self.page_ids = [i for _, i in pages]
+
+    def filter_ids(self, query: str) -> list:
+        """
+        Quote indices matching a filter:
+        - "p:10-40" (or "p:12", "p:ix-xii", "p:iv-20") for a page range
+        - "#tag" for quotes with that suggested tag
+        - anything else as a phrase; matches indexed phrases containing it
+        """
+        query = query.strip().lower()
+        if not query:
+            return list(range(len(self.quotes)))
+
+        if query.startswith("p:"):
+            low, _, high = query[2:].partition("-")
+            low = page_sort_key(low)
+            high = page_sort_key(high) if high.strip() else low
+            # Only page numbers, arabic or roman, make a range
+            if low[0] == 2 or high[0] == 2:
+                self.notify("Page filter looks like p:10-40", severity="warning")
+                return []
+            start = bisect_left(self.page_keys, low)
+            stop = bisect_right(self.page_keys, high)
+            return sorted(self.page_ids[start:stop])
+
+        if query.startswith("#"):
+            return sorted(self.suggested_index.get(query[1:].strip(), ()))
+
+        phrase = "-".join(query.split())
+        ids = set(self.index.quotes_with(phrase))
+        for indexed, quote_ids in self.index.postings.items():
+            if phrase in indexed:
+                ids.update(quote_ids)
+        return sorted(ids)
+
+    def compose(self) -> ComposeResult:
+        yield Container(
+            Static("", id="bulk-header", classes="step-title"),
+            id="header-box"
+        )
+
+        yield Input(placeholder="Filter: phrase, p:10-40 (pages) or #suggested-tag — press Enter", id="filter-input")
+        yield DataTable(id="quote-table", cursor_type="row", zebra_stripes=True)
+
+        yield Container(
+            Input(placeholder="Tag to apply to selected quotes (or to all shown if none selected)", id="bulk-tag-input"),
+            Horizontal(
+                Button("← Back", variant="default", id="back-btn"),
+                Button("Select Shown", variant="default", id="select-all-btn"),
+                Button("Clear Selection", variant="default", id="clear-btn"),
+                Button("Apply Tag", variant="primary", id="apply-btn"),
+                id="button-row"
+            ),
+            id="footer-box"
+        )
+
+    def on_mount(self) -> None:
+        table = self.query_one("#quote-table", DataTable)
+        table.add_column("✓", key="selected", width=2)
+        table.add_column("Page", key="page", width=6)
+        table.add_column("Quote", key="text")
+        table.add_column("Tags", key="tags")
+        self.show_rows(self.shown)
+
+    def show_rows(self, ids: list) -> None:
+        """Replace the table contents with the given quotes."""
+        self.shown = ids
+        table = self.query_one("#quote-table", DataTable)
+        table.clear()
+        for i in ids:
+            table.add_row(*self.row_cells(i), key=str(i))
+        self.update_header()
+
+    def row_cells(self, i: int) -> tuple:
+        quote = self.quotes[i]
+        text = quote["text"]
+        if len(text) > self.PREVIEW_LENGTH:
+            text = text[:self.PREVIEW_LENGTH - 1] + "…"
+        return (
+            "✓" if i in self.selected else "",
+            str(quote["page"]),
+            text,
+            ", ".join(quote.get("tags", [])),
+        )
+
+    def update_header(self) -> None:
+        self.query_one("#bulk-header", Static).update(
+            f"Bulk Tag: {len(self.shown)} of {len(self.quotes)} quotes shown, "
+            f"{len(self.selected)} selected"
+        )
+
+    def set_selected(self, ids, selected: bool) -> None:
+        table = self.query_one("#quote-table", DataTable)
+        for i in ids:
+            if selected:
+                self.selected.add(i)
+            else:
+                self.selected.discard(i)
+            if str(i) in table.rows:
+                table.update_cell(str(i), "selected", "✓" if selected else "")
+        self.update_header()
+
+    def on_data_table_row_selected(self, event: DataTable.RowSelected) -> None:
+        """Enter on a row toggles it in the selection."""
+        i = int(event.row_key.value)
+        self.set_selected([i], i not in self.selected)
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        if event.input.id == "filter-input":
+            self.show_rows(self.filter_ids(event.value))
+        elif event.input.id == "bulk-tag-input":
+            self.apply_tag()
+
+    def apply_tag(self) -> None:
+        """Add the typed tag to the selection, or to every shown quote if none."""
+        tag_input = self.query_one("#bulk-tag-input", Input)
+        tag = tag_input.value.strip().lower().replace(" ", "-")
+        if not tag:
+            self.notify("Type a tag to apply first", severity="warning")
+            return
+
+        targets = sorted(self.selected) if self.selected else self.shown
+        table = self.query_one("#quote-table", DataTable)
+        for i in targets:
+            tags = self.quotes[i].setdefault("tags", [])
+            if tag not in tags:
+                tags.append(tag)
+                if str(i) in table.rows:
+                    table.update_cell(str(i), "tags", ", ".join(tags))
+
+        tag_input.value = ""
+        self.notify(f"Tagged {len(targets)} quotes with '{tag}'")
+
+    def on_button_pressed(self, event: Button.Pressed) -> None:
+        if event.button.id == "apply-btn":
+            self.apply_tag()
+        elif event.button.id == "select-all-btn":
+            self.set_selected(self.shown, True)
+        elif event.button.id == "clear-btn":
+            self.set_selected(list(self.selected), False)
+        elif event.button.id == "back-btn":
+            self.app.pop_screen()
+
+
 # --------------------------
 # Screen 5: Review
 # --------------------------
@@ -740,10 +1065,11 @@ class ReviewScreen(Screen):
     }
     """
 
-    def __init__(self, quotes: list, metadata: dict):
+    def __init__(self, quotes: list, metadata: dict, index: PhraseIndex = None):
         super().__init__()
         self.quotes = quotes
         self.metadata = metadata
+        self.index = index
 
     def compose(self) -> ComposeResult:
         yield Container(
@@ -770,7 +1096,7 @@ class ReviewScreen(Screen):
             Static(f"• {self.metadata['source_slug']}.md (source note)", classes="info-line"),
             Static(f"• {self.metadata['author_slug']}.md (author note)", classes="info-line"),
             Static(f"• {len(self.quotes)} quote notes", classes="info-line"),
-            Static(f"• Output: ../../scribsidian_outputs/", classes="info-line"),
+            Static(f"• Output: {DEFAULT_OUTPUT_DIR}/", classes="info-line"),
 
             id="content-area"
         )
@@ -795,21 +1121,46 @@ class ReviewScreen(Screen):
 
     def generate_files(self) -> None:
         """Generate all markdown files."""
+        stats = self.app.stats
         try:
-            # Create output directory
-            output_dir = Path("../../scribsidian_outputs").resolve()
-            output_dir.mkdir(parents=True, exist_ok=True)
-            os.chdir(output_dir)
-
-            # Write notes
-            write_author_note(self.metadata)
-            write_source_note(self.metadata)
-
-            for quote in self.quotes:
-                write_quote_file(quote, self.metadata)
+            with stats.stage("write"):
+                # Create output directory
+                output_dir = Path(DEFAULT_OUTPUT_DIR).resolve()
+                output_dir.mkdir(parents=True, exist_ok=True)
+                os.chdir(output_dir)
+
+                # Skip notes unchanged since the last import unless a full rewrite was asked for
+                manifest = load_import_manifest(output_dir)
+                notes = render_keyed_notes(self.quotes, self.metadata)
+
+                # jobs > 1 writes concurrently and reports failed files instead of aborting
+                written, skipped, errors = write_book_notes(
+                    notes, output_dir, manifest, jobs=self.app.jobs, fsync=self.app.fsync,
+                    force=self.app.full, registry=SlugRegistry.scan(output_dir), stats=stats
+                )
+                if errors:
+                    self.notify(
+                        f"Failed to write {len(errors)} of {len(notes)} notes: "
+                        + ", ".join(sorted(errors)[:3]),
+                        severity="error"
+                    )
+
+                save_import_manifest(output_dir, manifest)
+                if self.index is not None:
+                    self.index.save(phrase_index_path(output_dir, self.metadata))
+
+            if self.app.related:
+                with stats.stage("related"):
+                    index = self.index if self.index is not None else PhraseIndex.build(self.quotes)
+                    related_index = RelatedIndex.load(output_dir)
+                    stats.count("related links updated", link_related_quotes(
+                        related_index, output_dir, self.quotes, self.metadata, manifest,
+                        index.quote_phrases
+                    ))
+                    related_index.save(output_dir)
 
             # Show completion screen
-            self.app.push_screen(CompletedScreen(len(self.quotes), output_dir))
+            self.app.push_screen(CompletedScreen(len(self.quotes), output_dir, stats))
 
         except Exception as e:
             self.notify(f"Error generating files: {e}", severity="error")
@@ -854,6 +1205,12 @@ class CompletedScreen(Screen):
         margin-bottom: 2;
     }
 
+    .stats {
+        width: 100%;
+        content-align: center middle;
+        color: $text-muted;
+    }
+
     #button-container {
         align: center middle;
         width: 100%;
@@ -866,10 +1223,11 @@ class CompletedScreen(Screen):
     }
     """
 
-    def __init__(self, quote_count: int, output_dir: Path):
+    def __init__(self, quote_count: int, output_dir: Path, stats: PipelineStats = None):
         super().__init__()
         self.quote_count = quote_count
         self.output_dir = output_dir
+        self.stats = stats
 
     def compose(self) -> ComposeResult:
         yield Container(
@@ -882,6 +1240,7 @@ class CompletedScreen(Screen):
             Static("", classes="description"),
             Static("Output location:", classes="description"),
             Static(str(self.output_dir), classes="path"),
+            *self.compose_stats(),
             Static("", classes="description"),
             Horizontal(
                 Button("Done", variant="success", id="done-btn"),
@@ -890,6 +1249,18 @@ class CompletedScreen(Screen):
             id="complete-box"
         )
 
+    def compose_stats(self):
+        """Stage times and counters, the same numbers --profile prints."""
+        if self.stats is None:
+            return []
+        rows = self.stats.rows()
+        width = max(len(label) for label, _ in rows)
+        return [
+            Static("Stage summary:", classes="description"),
+            Static("\n".join(f"{label:<{width}}  {value:>10}" for label, value in rows),
+                   classes="stats"),
+        ]
+
     def on_button_pressed(self, event: Button.Pressed) -> None:
         if event.button.id == "done-btn":
             self.app.exit()
@@ -915,9 +1286,21 @@ class ScribsidianApp(App):
     TITLE = "Scribsidian - Kindle to Obsidian"
     SUB_TITLE = "Transform Kindle highlights into Obsidian notes"
 
-    def __init__(self, test_mode: bool = False):
+    def __init__(self, test_mode: bool = False, engine: str = "frequency",
+                 fsync: bool = False, jobs: int = 1, full: bool = False, use_cache: bool = True,
+                 classifier: PatternClassifier = None, stats: PipelineStats = None,
+                 dedup: bool = True, related: bool = False):
         super().__init__()
         self.test_mode = test_mode
+        self.tag_engine = engine
+        self.fsync = fsync
+        self.jobs = jobs
+        self.full = full
+        self.use_cache = use_cache
+        self.classifier = classifier
+        self.stats = stats if stats is not None else PipelineStats()
+        self.dedup = dedup
+        self.related = related
 
     def compose(self) -> ComposeResult:
         """Compose the app layout with header and footer."""
@@ -933,9 +1316,14 @@ class ScribsidianApp(App):
             self.push_screen(WelcomeScreen())
 
 
-def run_tui(test_mode: bool = False):
+def run_tui(test_mode: bool = False, engine: str = "frequency", fsync: bool = False,
+            jobs: int = 1, full: bool = False, use_cache: bool = True,
+            classifier: PatternClassifier = None, stats: PipelineStats = None,
+            dedup: bool = True, related: bool = False):
     """Entry point for TUI mode."""
-    app = ScribsidianApp(test_mode=test_mode)
+    app = ScribsidianApp(test_mode=test_mode, engine=engine, fsync=fsync, jobs=jobs, full=full,
+                         use_cache=use_cache, classifier=classifier, stats=stats, dedup=dedup,
+                         related=related)
     app.run()
 
 
@@ -0,0 +1,163 @@
+"""Regression tests for scribsidian.py. Run with: python -m pytest"""
+
+import scribsidian
+
+
+class TerminalStream:
+    """Lines of a paste that, like a terminal's stdin, must not be read again after EOF."""
+
+    def __init__(self, text):
+        self.lines = iter(text.splitlines(keepends=True))
+        self.exhausted = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.exhausted:
+            raise AssertionError("stream read again after EOF")
+        try:
+            return next(self.lines)
+        except StopIteration:
+            self.exhausted = True
+            raise
+
+
+def test_short_paste_is_read_once():
+    books = scribsidian.split_export_books(TerminalStream(scribsidian.TEST_QUOTES))
+    assert [len(quotes) for _, quotes in books] == [3]
+
+
+def write_test_book(output_dir, manifest):
+    quotes = scribsidian.parse_quotes(scribsidian.TEST_QUOTES)
+    metadata = dict(scribsidian.TEST_METADATA)
+    metadata["author_slug"] = scribsidian.slugify(metadata["author"])
+    metadata["source_slug"] = scribsidian.slugify(metadata["title"])
+    notes = scribsidian.render_keyed_notes(quotes, metadata)
+    return scribsidian.write_book_notes(
+        notes, output_dir, manifest, registry=scribsidian.SlugRegistry.scan(output_dir)
+    )
+
+
+def test_reimport_recreates_deleted_notes(tmp_path):
+    manifest = {}
+    written, skipped, _ = write_test_book(tmp_path, manifest)
+    assert (written, skipped) == (5, 0)
+
+    author_note = tmp_path / "james-williams.md"
+    author_note.unlink()
+    written, skipped, _ = write_test_book(tmp_path, manifest)
+    assert (written, skipped) == (1, 4)
+    assert author_note.exists()
+
+
+def test_merging_duplicates_loses_no_highlight_text():
+    passage = (
+        "The liberation of human attention may be the defining moral and political "
+        "struggle of our time, and its success is a prerequisite for virtually all "
+        "other struggles"
+    )
+    words = passage.split()
+    texts = [
+        passage,
+        " ".join(words[:12]),                                        # contained
+        passage,                                                     # repeated
+        " ".join(words[3:]) + " we care about today and tomorrow",  # overlaps, adds text
+    ]
+    quotes = [scribsidian.Quote(str(page), text) for page, text in enumerate(texts, 1)]
+
+    kept, signatures, merged, overlapping = scribsidian.merge_near_duplicates(quotes)
+
+    assert (merged, overlapping) == (2, 1)
+    assert len(signatures) == len(kept)
+    kept_text = " ".join(q["text"] for q in kept)
+    for text in texts:
+        assert all(word in kept_text.split() for word in text.split())
+
+
+def test_rewritten_notes_keep_related_links(tmp_path):
+    manifest = {}
+    write_test_book(tmp_path, manifest)
+    note = tmp_path / "liberation-of-human-attention-may-be-the-defining-moral-and.md"
+    scribsidian.write_related_links(note, ["people-were-computers-however-the-appropriate-description-of"])
+
+    # A rewrite without --related, e.g. after the note's tags changed
+    for entry in manifest.values():
+        entry["sha1"] = ""
+    write_test_book(tmp_path, manifest)
+    assert scribsidian.read_related_links(note) == [
+        "people-were-computers-however-the-appropriate-description-of"
+    ]
+
+
+def test_related_index_prunes_deleted_notes():
+    index = scribsidian.RelatedIndex()
+    index.update([
+        ("a", "note-a", ["human-attention", "moral-struggle"]),
+        ("b", "note-b", ["human-attention", "moral-struggle"]),
+        ("c", "note-c", ["human-attention", "political-struggle"]),
+    ])
+    assert "note-b" in index.related(index.position["a"])
+
+    rescore = index.prune({"a": "note-a", "c": "note-c"})
+    assert rescore == ["a", "c"]
+    changed = index.update([], rescore)
+    assert changed == {index.position["a"], index.position["c"]}
+    assert index.keys == ["a", "c"]
+    for row in range(len(index)):
+        assert "note-b" not in index.related(row)
+
+
+def test_batch_reports_unnamed_export_per_entry(tmp_path, capsys):
+    exports = tmp_path / "exports"
+    exports.mkdir()
+    (exports / "unnamed.txt").write_text(scribsidian.TEST_QUOTES)
+    (exports / "named.txt").write_text(scribsidian.TEST_QUOTES)
+    manifest = tmp_path / "books.json"
+    manifest.write_text(
+        '[{"file": "unnamed.txt"},'
+        ' {"file": "named.txt", "title": "Stand out of our Light", "author": "James Williams"}]'
+    )
+
+    failures = scribsidian.main_batch(
+        exports, manifest, output_dir=tmp_path / "vault", workers=1, use_cache=False
+    )
+    assert failures == 1
+    assert "unnamed.txt: the export does not name its book" in capsys.readouterr().out
+    assert (tmp_path / "vault" / "stand-out-of-our-light.md").exists()
+
+
+def test_batch_names_colliding_notes_in_manifest_order(tmp_path):
+    exports = tmp_path / "exports"
+    exports.mkdir()
+    # The first book is the bigger one, so it tends to finish last
+    (exports / "first.txt").write_text(scribsidian.TEST_QUOTES * 50)
+    (exports / "second.txt").write_text(scribsidian.TEST_QUOTES)
+    manifest = tmp_path / "books.json"
+    manifest.write_text(
+        '[{"file": "first.txt", "title": "First", "author": "A"},'
+        ' {"file": "second.txt", "title": "Second", "author": "B"}]'
+    )
+
+    vault = tmp_path / "vault"
+    assert scribsidian.main_batch(
+        exports, manifest, output_dir=vault, workers=2, use_cache=False, dedup=False
+    ) == 0
+    note = (vault / "liberation-of-human-attention-may-be-the-defining-moral-and.md").read_text()
+    assert 'source: "[[first]]"' in note
+
+
+def test_quote_text_may_start_with_page():
+    export = (
+        "Page 12 | Highlight\n"
+        "Page after page, the argument builds.\n"
+        "Page 13 | Note\n"
+        "A note of mine.\n"
+        "Page 14 | Highlight (Yellow)\n"
+        "Second quote.\n"
+    )
+    quotes = scribsidian.parse_quotes(export)
+    assert [(q["page"], q["text"]) for q in quotes] == [
+        ("12", "Page after page, the argument builds."),
+        ("14", "Second quote."),
+    ]